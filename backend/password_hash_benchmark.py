@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark
+Reports login throughput (password verifications per second) per core and
+for the whole worker pool at each cost setting, using the same CryptContext
+the server builds.
+
+    python password_hash_benchmark.py
+    python password_hash_benchmark.py --scheme bcrypt --costs 10,11,12,13
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from server import build_password_context, PASSWORD_HASH_WORKERS
+
+# Cost parameter varied for each scheme, and the values tried by default
+COST_PARAMETERS = {
+    "pbkdf2_sha256": ("pbkdf2_rounds", [100000, 210000, 310000, 600000]),
+    "bcrypt": ("bcrypt_rounds", [10, 11, 12, 13]),
+    "argon2": ("argon2_time_cost", [1, 2, 3, 4]),
+}
+
+PASSWORD = "correct horse battery staple"
+
+def measure(context, hashed: str, iterations: int, workers: int) -> float:
+    """Returns verifications per second using the given number of threads."""
+    start = time.perf_counter()
+    if workers == 1:
+        for _ in range(iterations):
+            context.verify(PASSWORD, hashed)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda _: context.verify(PASSWORD, hashed), range(iterations)))
+    return iterations / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scheme", default="pbkdf2_sha256", choices=sorted(COST_PARAMETERS))
+    parser.add_argument("--costs", help="comma separated cost values to try")
+    parser.add_argument("--seconds", type=float, default=2.0, help="target run time per setting")
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    parameter, costs = COST_PARAMETERS[args.scheme]
+    if args.costs:
+        costs = [int(cost) for cost in args.costs.split(",")]
+
+    print(f"Scheme: {args.scheme}  cores: {os.cpu_count()}  workers: {args.workers}")
+    print(f"{'cost':>10} {'verify ms':>10} {'logins/s/core':>14} {'logins/s (pool)':>16}")
+
+    for cost in costs:
+        try:
+            context = build_password_context(args.scheme, **{parameter: cost})
+            hashed = context.hash(PASSWORD)
+        except Exception as e:
+            print(f"{cost:>10} unavailable: {e}")
+            continue
+
+        # Size the run from a single timed verification
+        start = time.perf_counter()
+        context.verify(PASSWORD, hashed)
+        single = time.perf_counter() - start
+        iterations = max(3, int(args.seconds / max(single, 1e-6)))
+
+        per_core = measure(context, hashed, iterations, 1)
+        pooled = measure(context, hashed, iterations * args.workers, args.workers)
+        print(f"{cost:>10} {1000 / per_core:>10.1f} {per_core:>14.1f} {pooled:>16.1f}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,34 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from pathlib import Path
+from urllib.parse import quote
 import os
 import logging
 import uuid
 import hashlib
 import base64
+import binascii
 import json
+import gzip
+import re
+import time
+import asyncio
+import secrets
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+import jwt
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -31,6 +47,110 @@ api_router = APIRouter(prefix="/api")
 # Security
 security = HTTPBearer()
 
+# Signed access tokens
+# If JWT_SECRET_KEY is unset, a random key is generated once and stored in
+# db.app_secrets at startup so every worker (and restart) signs with the same key.
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
+JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+REVOCATION_SYNC_SECONDS = float(os.environ.get("REVOCATION_SYNC_SECONDS", "30"))
+# Old raw-user-id bearer tokens are rejected: user ids are visible to other
+# users, so they can't serve as credentials. ALLOW_LEGACY_TOKENS=true only
+# exists as a short-lived escape hatch during a rollout.
+ALLOW_LEGACY_TOKENS = os.environ.get("ALLOW_LEGACY_TOKENS", "false").lower() == "true"
+
+# Password hashing
+# New hashes use PASSWORD_HASH_SCHEME ("pbkdf2_sha256", "bcrypt" or "argon2";
+# the latter two need their optional backends installed). Hashes made with any
+# other scheme or with a lower cost are upgraded on the next successful login.
+# Run backend/password_hash_benchmark.py to pick costs for the target hardware.
+PASSWORD_HASH_SCHEME = os.environ.get("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+PBKDF2_SHA256_ROUNDS = int(os.environ.get("PBKDF2_SHA256_ROUNDS", "310000"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", "4"))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Auth throttling
+# Login, registration and password reset attempts are limited per client IP
+# and per email over a sliding window. AUTH_RATE_LIMIT_BACKEND "memory" keeps
+# counts per worker; "mongo" also shares them through db.auth_rate_limits.
+# AUTH_RATE_LIMIT_TRUSTED_PROXIES is the number of proxies in front of the
+# app: 0 means clients connect directly, N reads the client from the Nth
+# X-Forwarded-For entry from the right. Left unset, the per-IP limit is off,
+# since behind an unconfigured proxy every client would share one address.
+AUTH_RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get("AUTH_RATE_LIMIT_WINDOW_SECONDS", "300"))
+AUTH_RATE_LIMIT_PER_IP = int(os.environ.get("AUTH_RATE_LIMIT_PER_IP", "30"))
+AUTH_RATE_LIMIT_PER_EMAIL = int(os.environ.get("AUTH_RATE_LIMIT_PER_EMAIL", "10"))
+AUTH_RATE_LIMIT_BACKEND = os.environ.get("AUTH_RATE_LIMIT_BACKEND", "memory")
+AUTH_RATE_LIMIT_MAX_KEYS = int(os.environ.get("AUTH_RATE_LIMIT_MAX_KEYS", "100000"))
+AUTH_RATE_LIMIT_TRUSTED_PROXIES = (
+    int(os.environ["AUTH_RATE_LIMIT_TRUSTED_PROXIES"]) if os.environ.get("AUTH_RATE_LIMIT_TRUSTED_PROXIES") else None
+)
+
+# Notifications
+NOTIFICATION_FANOUT_CHUNK_SIZE = int(os.environ.get("NOTIFICATION_FANOUT_CHUNK_SIZE", "500"))
+NOTIFICATION_QUEUE_SIZE = int(os.environ.get("NOTIFICATION_QUEUE_SIZE", "10000"))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get("NOTIFICATION_BATCH_SIZE", "200"))
+NOTIFICATION_ENQUEUE_TIMEOUT_SECONDS = float(os.environ.get("NOTIFICATION_ENQUEUE_TIMEOUT_SECONDS", "2"))
+NOTIFICATION_FLUSH_TIMEOUT_SECONDS = float(os.environ.get("NOTIFICATION_FLUSH_TIMEOUT_SECONDS", "10"))
+NOTIFICATION_STREAM_KEEPALIVE_SECONDS = float(os.environ.get("NOTIFICATION_STREAM_KEEPALIVE_SECONDS", "15"))
+UNREAD_RECONCILE_SECONDS = float(os.environ.get("UNREAD_RECONCILE_SECONDS", "3600"))
+# Read notifications older than the retention period are archived and then
+# expired by a TTL index (0 keeps them forever). NOTIFICATION_ARCHIVE is
+# "collection" (zstd-compressed notifications_archive), "ndjson" (gzipped
+# files under NOTIFICATION_ARCHIVE_DIR) or "none".
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_ARCHIVE = os.environ.get("NOTIFICATION_ARCHIVE", "collection")
+NOTIFICATION_ARCHIVE_DIR = Path(os.environ.get("NOTIFICATION_ARCHIVE_DIR", str(ROOT_DIR / "archive")))
+NOTIFICATION_ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("NOTIFICATION_ARCHIVE_INTERVAL_SECONDS", "3600"))
+NOTIFICATION_ARCHIVE_BATCH_SIZE = int(os.environ.get("NOTIFICATION_ARCHIVE_BATCH_SIZE", "1000"))
+
+# Pagination
+# List endpoints return the full collection unless a limit or cursor is given.
+# Set LEGACY_UNPAGINATED_LISTS=false to page by default once clients follow
+# the X-Next-Cursor header.
+LEGACY_UNPAGINATED_LISTS = os.environ.get("LEGACY_UNPAGINATED_LISTS", "true").lower() == "true"
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "500"))
+
+# Search
+# "text" uses the weighted text index and ranks by relevance; "regex" is the
+# original case-insensitive substring match.
+DEFAULT_SEARCH_MODE = os.environ.get("DEFAULT_SEARCH_MODE", "text")
+
+# Categories
+CATEGORIES_CACHE_SECONDS = float(os.environ.get("CATEGORIES_CACHE_SECONDS", "30"))
+REBUILD_CATEGORIES_ON_STARTUP = os.environ.get("REBUILD_CATEGORIES_ON_STARTUP", "false").lower() == "true"
+REBUILD_BID_SUMMARIES_ON_STARTUP = os.environ.get("REBUILD_BID_SUMMARIES_ON_STARTUP", "false").lower() == "true"
+# Duplicate bids must be collapsed before the unique (request_id, supervisor_id)
+# index can be built. This deletes bids, so it is opt-in; it also runs only
+# while that index is missing. POST /api/admin/bids/collapse-duplicates does
+# the same on demand.
+COLLAPSE_DUPLICATE_BIDS_ON_STARTUP = os.environ.get("COLLAPSE_DUPLICATE_BIDS_ON_STARTUP", "false").lower() == "true"
+
+# Settings
+SETTINGS_SYNC_SECONDS = float(os.environ.get("SETTINGS_SYNC_SECONDS", "5"))
+BRANDING_CACHE_CONTROL = os.environ.get("BRANDING_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=600")
+
+# Attachment storage
+# "gridfs" keeps blobs in Mongo (shared by all workers); "filesystem" stores
+# them content-addressed under ATTACHMENT_DIR.
+ATTACHMENT_STORAGE = os.environ.get("ATTACHMENT_STORAGE", "gridfs")
+ATTACHMENT_DIR = Path(os.environ.get("ATTACHMENT_DIR", str(ROOT_DIR / "attachments")))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+MIGRATE_ATTACHMENTS_ON_STARTUP = os.environ.get("MIGRATE_ATTACHMENTS_ON_STARTUP", "true").lower() == "true"
+
+# Bids
+# Bid acceptance runs in a transaction when Mongo supports it (replica set or
+# mongos). "auto" falls back to guarded single-document writes on a
+# standalone server; "true" requires transactions, "false" never uses them.
+BID_ACCEPT_TRANSACTIONS = os.environ.get("BID_ACCEPT_TRANSACTIONS", "auto").lower()
+BID_ACCEPT_LATENCY_SAMPLES = int(os.environ.get("BID_ACCEPT_LATENCY_SAMPLES", "1000"))
+
 # Models
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -52,6 +172,29 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class TokenLogout(BaseModel):
+    refresh_token: Optional[str] = None
+
+class Attachment(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    content_type: str = "application/octet-stream"
+    size: int
+    sha256: str
+    storage_key: str
+    uploaded_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AttachmentRef(BaseModel):
+    id: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+
 class EssayRequest(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     student_id: str
@@ -60,19 +203,32 @@ class EssayRequest(BaseModel):
     word_count: int
     assignment_type: str  # essay, dissertation_qualitative, dissertation_quantitative, statistical_analysis, paraphrase, ai_detection, translation
     field_of_study: str  # engineering, etc.
-    attachments: List[str] = []  # base64 encoded files
+    attachments: List[AttachmentRef] = []  # bytes live in the attachment store
     extra_information: Optional[str] = None
     status: str = "pending"  # pending, accepted, rejected, completed
     created_at: datetime = Field(default_factory=datetime.utcnow)
     assigned_supervisor: Optional[str] = None
 
+class EssayRequestSummary(BaseModel):
+    # What the request list views render; no attachments or free text
+    id: str
+    student_id: str
+    title: str
+    due_date: datetime
+    word_count: int
+    assignment_type: str
+    field_of_study: str
+    status: str
+    created_at: datetime
+    assigned_supervisor: Optional[str] = None
+
 class EssayRequestCreate(BaseModel):
     title: str
     due_date: datetime
     word_count: int
     assignment_type: str
     field_of_study: str
-    attachments: List[str] = []
+    attachments: List[str] = []  # attachment ids (base64 file contents still accepted)
     extra_information: Optional[str] = None
 
 class Bid(BaseModel):
@@ -84,6 +240,17 @@ class Bid(BaseModel):
     status: str = "pending"  # pending, accepted, rejected
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class BidSummary(BaseModel):
+    request_id: str
+    count: int = 0
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    mean_price: Optional[float] = None
+    median_price: Optional[float] = None
+    latest_bid_at: Optional[datetime] = None
+    distinct_supervisors: int = 0
+    status_counts: Dict[str, int] = {}
+
 class SystemSettings(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     site_title: str = "Essay Bid Submission System"
@@ -178,6 +345,9 @@ class ChatMessage(BaseModel):
     approved: bool = False
     approved_by: Optional[str] = None
     approved_at: Optional[datetime] = None
+    # When the message became visible to the reader: sent for admins, approved
+    # for everyone else. Only ever moves forward, so deltas page on it.
+    visible_at: Optional[datetime] = None
 
 class ChatMessageCreate(BaseModel):
     request_id: str
@@ -215,16 +385,695 @@ class Notification(BaseModel):
     read: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-# Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+class NotificationIds(BaseModel):
+    ids: List[str]
+
+# Database indexes
+# Every collection declares the full set of indexes the queries below rely on.
+# The startup hook creates anything missing and reports indexes that exist in
+# Mongo but are not declared here (set DROP_UNEXPECTED_INDEXES=true to drop them).
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("role", ASCENDING)], name="role"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+    "essay_requests": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("student_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="student_id_created_at_id",
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="status_created_at_id",
+        ),
+        IndexModel([("assigned_supervisor", ASCENDING), ("status", ASCENDING)], name="assigned_supervisor_status"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("field_of_study", ASCENDING)], name="field_of_study"),
+        IndexModel([("attachments.id", ASCENDING)], name="attachments_id"),
+        IndexModel(
+            [("title", TEXT), ("field_of_study", TEXT), ("assignment_type", TEXT), ("extra_information", TEXT)],
+            name="text_search",
+            weights={"title": 10, "field_of_study": 5, "assignment_type": 3, "extra_information": 1},
+            default_language="english",
+            language_override="search_language",
+        ),
+    ],
+    "bids": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("request_id", ASCENDING), ("status", ASCENDING)], name="request_id_status"),
+        # One bid per supervisor per request; re-bidding replaces it
+        IndexModel(
+            [("request_id", ASCENDING), ("supervisor_id", ASCENDING)],
+            name="request_id_supervisor_id_unique",
+            unique=True,
+        ),
+        IndexModel(
+            [("supervisor_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="supervisor_id_created_at_id",
+        ),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+    "chat_messages": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("request_id", ASCENDING), ("approved", ASCENDING), ("timestamp", ASCENDING)],
+            name="request_id_approved_timestamp",
+        ),
+        IndexModel([("request_id", ASCENDING), ("timestamp", ASCENDING)], name="request_id_timestamp"),
+        IndexModel(
+            [("request_id", ASCENDING), ("approved", ASCENDING), ("visible_at", ASCENDING), ("id", ASCENDING)],
+            name="request_id_approved_visible_at_id",
+        ),
+        IndexModel(
+            [("request_id", ASCENDING), ("visible_at", ASCENDING), ("id", ASCENDING)],
+            name="request_id_visible_at_id",
+        ),
+        IndexModel(
+            [("approved", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)],
+            name="approved_timestamp_id",
+        ),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_created_at_id",
+        ),
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING), ("created_at", ASCENDING)], name="user_id_read_created_at"),
+        IndexModel([("read", ASCENDING), ("created_at", ASCENDING)], name="read_created_at"),
+    ],
+    "notifications_archive": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+    ],
+    "notification_counters": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "questions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_id_created_at_id",
+        ),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+    ],
+    "admin_prices": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("request_id", ASCENDING), ("visible_to_student", ASCENDING)], name="request_id_visible"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+    "bid_summaries": [
+        IndexModel([("request_id", ASCENDING)], name="request_id_unique", unique=True),
+    ],
+    "revoked_tokens": [
+        # Unique so a refresh token can be claimed atomically across workers
+        IndexModel(
+            [("jti", ASCENDING)],
+            name="jti_unique",
+            unique=True,
+            partialFilterExpression={"jti": {"$exists": True}},
+        ),
+        IndexModel([("user_id", ASCENDING)], name="user_id", sparse=True),
+        IndexModel([("type", ASCENDING), ("expires_at", ASCENDING)], name="type_expires_at"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "auth_rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "attachments": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("sha256", ASCENDING)], name="sha256"),
+    ],
+    "admin_settings": [
+        IndexModel(
+            [("singleton", ASCENDING)],
+            name="singleton_unique",
+            unique=True,
+            partialFilterExpression={"singleton": True},
+        ),
+    ],
+    "system_settings": [
+        IndexModel(
+            [("singleton", ASCENDING)],
+            name="singleton_unique",
+            unique=True,
+            partialFilterExpression={"singleton": True},
+        ),
+    ],
+    "categories": [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    "payment_info": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("request_id", ASCENDING)], name="request_id"),
+        IndexModel([("student_id", ASCENDING)], name="student_id"),
+        IndexModel([("bid_id", ASCENDING)], name="bid_id"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+}
+
+if NOTIFICATION_RETENTION_DAYS > 0:
+    # When archiving, only documents the archiver has copied out may expire
+    INDEX_SPECS["notifications"].append(IndexModel(
+        [("created_at", ASCENDING)],
+        name="created_at_ttl",
+        expireAfterSeconds=NOTIFICATION_RETENTION_DAYS * 86400,
+        partialFilterExpression={"archived": True} if NOTIFICATION_ARCHIVE != "none" else {"read": True},
+    ))
+
+# Indexes that must be removed when present, not just reported as unexpected
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    "revoked_tokens": ["jti"],  # replaced by jti_unique
+}
+if NOTIFICATION_RETENTION_DAYS <= 0:
+    # Retention disabled: a TTL index left over from earlier config would keep deleting
+    RETIRED_INDEXES["notifications"] = ["created_at_ttl"]
+
+def index_differs(model: IndexModel, existing: Dict[str, Any]) -> bool:
+    # Options that can't be changed in place; a mismatch means drop and rebuild
+    document = model.document
+    # Text indexes are stored under _fts/_ftsx keys, so their fields can't be compared
+    is_text = TEXT in document["key"].values()
+    return (
+        (not is_text and list(document["key"].items()) != [tuple(key) for key in existing["key"]])
+        or bool(document.get("unique")) != bool(existing.get("unique"))
+        or document.get("partialFilterExpression") != existing.get("partialFilterExpression")
+    )
+
+# Last reconciliation result, exposed through /api/admin/indexes
+index_report: Dict[str, Dict[str, List[str]]] = {}
+
+async def ensure_indexes(drop_unexpected: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    await ensure_notification_archive()
+    report = {}
+    for collection_name, models in INDEX_SPECS.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared = {model.document["name"] for model in models}
+
+        retired = []
+        for name in RETIRED_INDEXES.get(collection_name, []):
+            if name in existing:
+                await collection.drop_index(name)
+                del existing[name]
+                retired.append(name)
+
+        # Rebuilt indexes are dropped here and recreated below as missing
+        rebuilt = []
+        for model in models:
+            name = model.document["name"]
+            if name in existing and index_differs(model, existing[name]):
+                logger.warning(f"Index {collection_name}.{name} does not match its declaration, rebuilding")
+                await collection.drop_index(name)
+                del existing[name]
+                rebuilt.append(name)
+
+        missing = [model for model in models if model.document["name"] not in existing]
+        created, failed = [], []
+        for model in missing:
+            # Create one at a time so a single failure (e.g. duplicate emails
+            # blocking a unique index) doesn't prevent the rest from being built
+            try:
+                await collection.create_indexes([model])
+                created.append(model.document["name"])
+            except OperationFailure as e:
+                failed.append(model.document["name"])
+                logger.error(f"Failed to create index {collection_name}.{model.document['name']}: {e}")
+
+        # TTL changes can be applied in place
+        updated = []
+        for model in models:
+            name = model.document["name"]
+            ttl = model.document.get("expireAfterSeconds")
+            if name in existing and ttl is not None and existing[name].get("expireAfterSeconds") != ttl:
+                await db.command("collMod", collection_name, index={"name": name, "expireAfterSeconds": ttl})
+                updated.append(name)
+
+        unexpected = [name for name in existing if name != "_id_" and name not in declared]
+        dropped = []
+        if drop_unexpected:
+            for name in unexpected:
+                await collection.drop_index(name)
+                dropped.append(name)
+
+        if created:
+            logger.info(f"Created indexes on {collection_name}: {created}")
+        if unexpected:
+            logger.warning(f"Unexpected indexes on {collection_name}: {unexpected}")
+
+        report[collection_name] = {
+            "created": created,
+            "rebuilt": rebuilt,
+            "retired": retired,
+            "updated": updated,
+            "missing": failed,
+            "unexpected": [name for name in unexpected if name not in dropped],
+            "dropped": dropped,
+        }
+
+    index_report.clear()
+    index_report.update(report)
+    return report
+
+# Password hashing
+# Key derivation is deliberately slow, so it runs on a bounded thread pool
+# instead of the event loop. hashlib's PBKDF2, bcrypt and argon2 all release
+# the GIL while hashing, so the pool scales across cores.
+PASSWORD_SCHEMES = ["pbkdf2_sha256", "bcrypt", "argon2"]
+
+def password_cost_settings(
+    pbkdf2_rounds: int = PBKDF2_SHA256_ROUNDS,
+    bcrypt_rounds: int = BCRYPT_ROUNDS,
+    argon2_time_cost: int = ARGON2_TIME_COST,
+    argon2_memory_cost: int = ARGON2_MEMORY_COST,
+    argon2_parallelism: int = ARGON2_PARALLELISM,
+) -> Dict[str, Any]:
+    # min_* settings make hashes below the current cost count as outdated
+    return {
+        "pbkdf2_sha256__default_rounds": pbkdf2_rounds,
+        "pbkdf2_sha256__min_rounds": pbkdf2_rounds,
+        "bcrypt__default_rounds": bcrypt_rounds,
+        "bcrypt__min_rounds": bcrypt_rounds,
+        "argon2__time_cost": argon2_time_cost,
+        "argon2__memory_cost": argon2_memory_cost,
+        "argon2__parallelism": argon2_parallelism,
+    }
+
+def build_password_context(scheme: str = PASSWORD_HASH_SCHEME, **costs) -> CryptContext:
+    if scheme not in PASSWORD_SCHEMES:
+        raise ValueError(f"Unsupported password hash scheme: {scheme}")
+    
+    # hex_sha256 is the original unsalted digest; it is only ever verified
+    # and is listed last so it does not shadow the other identifiers
+    schemes = [scheme] + [name for name in PASSWORD_SCHEMES if name != scheme] + ["hex_sha256"]
+    return CryptContext(
+        schemes=schemes,
+        default=scheme,
+        deprecated="auto",
+        **password_cost_settings(**costs),
+    )
+
+pwd_context = build_password_context()
+password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Returns (valid, new_hash); new_hash is set when the stored hash is outdated."""
+    if not hashed_password:
+        return False, None
+    
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            password_executor, pwd_context.verify_and_update, password, hashed_password
+        )
+    except ValueError:
+        # Unrecognised or malformed hash, or the scheme's backend is missing
+        logger.warning("Could not verify password hash", exc_info=True)
+        return False, None
+
+# Auth rate limiting
+# Sliding window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window, so each key only needs two
+# counters. Checks run before the handler touches db.users.
+class SlidingWindowLimiter:
+    def __init__(self, window_seconds: int, max_keys: int):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._windows: "OrderedDict[str, List[int]]" = OrderedDict()  # key -> [window, count, previous count]
+        self.allowed = 0
+        self.rejected = 0
+        self.shared_errors = 0
+
+    def _window(self, now: float) -> Tuple[int, float]:
+        window = int(now // self.window_seconds)
+        elapsed = (now - window * self.window_seconds) / self.window_seconds
+        return window, elapsed
+
+    def _counts(self, key: str, window: int) -> Tuple[int, int]:
+        entry = self._windows.get(key)
+        if entry is None:
+            return 0, 0
+        if entry[0] == window:
+            return entry[1], entry[2]
+        if entry[0] == window - 1:
+            return 0, entry[1]
+        return 0, 0
+
+    def _record(self, key: str, window: int, count: int, previous: int):
+        self._windows[key] = [window, count, previous]
+        self._windows.move_to_end(key)
+        while len(self._windows) > self.max_keys:
+            self._windows.popitem(last=False)
+
+    def retry_after(self, elapsed: float) -> int:
+        return max(1, int(self.window_seconds * (1 - elapsed)) + 1)
+
+    def check(self, limits: List[Tuple[str, int]]) -> Optional[int]:
+        """Counts one attempt against every key, or returns a Retry-After if any key is over its limit."""
+        window, elapsed = self._window(time.time())
+        counts = {key: self._counts(key, window) for key, _ in limits}
+        for key, limit in limits:
+            count, previous = counts[key]
+            if count + previous * (1 - elapsed) + 1 > limit:
+                self.rejected += 1
+                return self.retry_after(elapsed)
+
+        for key, _ in limits:
+            count, previous = counts[key]
+            self._record(key, window, count + 1, previous)
+        self.allowed += 1
+        return None
+
+    async def check_shared(self, limits: List[Tuple[str, int]]) -> Optional[int]:
+        """Same check against the counters shared by all workers in db.auth_rate_limits."""
+        window, elapsed = self._window(time.time())
+        expires_at = datetime.utcfromtimestamp((window + 2) * self.window_seconds)
+        try:
+            for key, limit in limits:
+                current, previous = await asyncio.gather(
+                    db.auth_rate_limits.find_one_and_update(
+                        {"_id": f"{key}:{window}"},
+                        {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": expires_at}},
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER,
+                    ),
+                    db.auth_rate_limits.find_one({"_id": f"{key}:{window - 1}"}),
+                )
+                previous_count = previous["count"] if previous else 0
+                if current["count"] + previous_count * (1 - elapsed) > limit:
+                    self.rejected += 1
+                    return self.retry_after(elapsed)
+        except Exception as e:
+            # Fail open: the per-worker limit still applies
+            self.shared_errors += 1
+            logger.error(f"Shared auth rate limit check failed: {e}")
+        return None
+
+    async def reset(self, key: str):
+        self._windows.pop(key, None)
+        if AUTH_RATE_LIMIT_BACKEND == "mongo":
+            window, _ = self._window(time.time())
+            await db.auth_rate_limits.delete_many({"_id": {"$in": [f"{key}:{window}", f"{key}:{window - 1}"]}})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": AUTH_RATE_LIMIT_BACKEND,
+            "window_seconds": self.window_seconds,
+            "per_ip": AUTH_RATE_LIMIT_PER_IP if AUTH_RATE_LIMIT_TRUSTED_PROXIES is not None else None,
+            "per_email": AUTH_RATE_LIMIT_PER_EMAIL,
+            "keys": len(self._windows),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "shared_errors": self.shared_errors,
+        }
+
+auth_rate_limiter = SlidingWindowLimiter(AUTH_RATE_LIMIT_WINDOW_SECONDS, AUTH_RATE_LIMIT_MAX_KEYS)
+
+def client_ip(request: Request, trusted_proxies: int) -> str:
+    peer = request.client.host if request.client else "unknown"
+    if trusted_proxies <= 0:
+        return peer
+    # Each trusted proxy appends the address it received the request from, so
+    # entries further left than that were supplied by the client and can't be trusted
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    if len(hops) < trusted_proxies:
+        return hops[0] if hops else peer
+    return hops[-trusted_proxies]
+
+def rate_limit_email_key(action: str, email: str) -> str:
+    return f"{action}:email:{email.strip().lower()}"
+
+async def check_auth_rate_limit(request: Request, action: str, email: Optional[str] = None):
+    limits = []
+    if AUTH_RATE_LIMIT_TRUSTED_PROXIES is not None:
+        limits.append((f"{action}:ip:{client_ip(request, AUTH_RATE_LIMIT_TRUSTED_PROXIES)}", AUTH_RATE_LIMIT_PER_IP))
+    if email:
+        limits.append((rate_limit_email_key(action, email), AUTH_RATE_LIMIT_PER_EMAIL))
+    
+    retry_after = auth_rate_limiter.check(limits)
+    if retry_after is None and AUTH_RATE_LIMIT_BACKEND == "mongo":
+        retry_after = await auth_rate_limiter.check_shared(limits)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+# Token -> User cache
+# Bounded LRU with a per-entry TTL so authenticated requests don't pay a Mongo
+# round trip each. Entries are dropped whenever the underlying user changes.
+class UserCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[User]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user: User):
+        if self.max_size <= 0:
+            return
+        self._entries[token] = (user, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str):
+        stale = [token for token, (user, _) in self._entries.items() if user.id == user_id]
+        for token in stale:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+user_cache = UserCache(
+    max_size=int(os.environ.get("USER_CACHE_MAX_SIZE", "10000")),
+    ttl_seconds=float(os.environ.get("USER_CACHE_TTL_SECONDS", "60")),
+)
+
+def create_token(user_id: str, email: str, name: str, role: str, token_type: str, expires_delta: timedelta) -> str:
+    now = time.time()
+    payload = {
+        "sub": user_id,
+        "email": email,
+        "name": name,
+        "role": role,
+        "type": token_type,
+        "jti": str(uuid.uuid4()),
+        "iat": now,
+        "exp": int(now + expires_delta.total_seconds()),
+    }
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+def issue_tokens(user_id: str, email: str, name: str, role: str) -> Dict[str, Any]:
+    access_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return {
+        "token": create_token(user_id, email, name, role, "access", access_expires),
+        "refresh_token": create_token(user_id, email, name, role, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)),
+        "token_type": "bearer",
+        "expires_in": int(access_expires.total_seconds()),
+    }
+
+def decode_token(token: str, token_type: str) -> Dict[str, Any]:
+    try:
+        claims = jwt.decode(
+            token,
+            JWT_SECRET_KEY,
+            algorithms=[JWT_ALGORITHM],
+            options={"require": ["sub", "type", "jti", "iat", "exp"]},
+        )
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    return hash_password(password) == hashed_password
+    if claims["type"] != token_type or token_revocations.is_revoked(claims):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return claims
+
+# Token revocation list
+# Revoked token ids and per-user "revoked before" cutoffs are persisted in
+# db.revoked_tokens (expired by a TTL index) and mirrored in memory, so the
+# per-request check never touches Mongo. Other workers pick up revocations on
+# the next sync.
+class TokenRevocationList:
+    def __init__(self):
+        self.revoked_jtis: Dict[str, float] = {}  # jti -> token expiry
+        self.revoked_users: Dict[str, float] = {}  # user_id -> revoked at
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        if claims["jti"] in self.revoked_jtis:
+            return True
+        revoked_at = self.revoked_users.get(claims["sub"])
+        return revoked_at is not None and claims["iat"] <= revoked_at
+
+    async def revoke_token(self, claims: Dict[str, Any]) -> bool:
+        """Returns False if the token had already been revoked, by any worker."""
+        # Refresh tokens are checked by the unique jti insert in refresh_token,
+        # so only short-lived access tokens are mirrored in memory
+        if claims["type"] == "access":
+            self.revoked_jtis[claims["jti"]] = claims["exp"]
+        try:
+            await db.revoked_tokens.insert_one({
+                "jti": claims["jti"],
+                "type": claims["type"],
+                "exp": claims["exp"],
+                "expires_at": datetime.utcfromtimestamp(claims["exp"]),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def revoke_user(self, user_id: str):
+        # Invalidates every token issued to the user so far, e.g. after a role change
+        revoked_at = time.time()
+        self.revoked_users[user_id] = revoked_at
+        await db.revoked_tokens.update_one(
+            {"user_id": user_id},
+            {"$set": {
+                "type": "user",
+                "revoked_at": revoked_at,
+                "expires_at": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+            }},
+            upsert=True,
+        )
+
+    async def sync(self):
+        # Keep unexpired local entries so a revocation made while the sync is
+        # in flight isn't lost
+        now = time.time()
+        revoked_jtis = {jti: exp for jti, exp in self.revoked_jtis.items() if exp > now}
+        revoked_users = dict(self.revoked_users)
+        # Access-token revocations and per-user cutoffs only; untyped rows were
+        # written before refresh tokens were left out and expire within a week
+        query = {"type": {"$in": ["access", "user", None]}, "expires_at": {"$gt": datetime.utcnow()}}
+        async for entry in db.revoked_tokens.find(query, {"_id": 0}):
+            if entry.get("jti"):
+                revoked_jtis[entry["jti"]] = entry["exp"]
+            elif entry.get("user_id"):
+                revoked_users[entry["user_id"]] = max(entry["revoked_at"], revoked_users.get(entry["user_id"], 0))
+        self.revoked_jtis = revoked_jtis
+        self.revoked_users = revoked_users
+
+token_revocations = TokenRevocationList()
+
+async def load_jwt_secret_key() -> str:
+    # The first worker to start stores a key; the rest read it back
+    generated = secrets.token_urlsafe(64)
+    try:
+        secret = await db.app_secrets.find_one_and_update(
+            {"_id": "jwt_secret_key"},
+            {"$setOnInsert": {"value": generated, "created_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Lost the upsert race to another worker
+        secret = await db.app_secrets.find_one({"_id": "jwt_secret_key"})
+    return secret["value"]
+
+async def dedupe_revoked_tokens():
+    # Older revocations could be written twice for one jti, which blocks the
+    # unique index; only needed until jti_unique has been built
+    indexes = await db.revoked_tokens.index_information()
+    if "jti_unique" in indexes:
+        return
+    pipeline = [
+        {"$match": {"jti": {"$exists": True}}},
+        {"$group": {"_id": "$jti", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in db.revoked_tokens.aggregate(pipeline):
+        await db.revoked_tokens.delete_many({"_id": {"$in": group["ids"][1:]}})
+
+async def sync_token_revocations():
+    while True:
+        try:
+            await token_revocations.sync()
+        except Exception as e:
+            logger.error(f"Failed to sync token revocation list: {e}")
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
 
 # Authentication middleware
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+    return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str) -> User:
+    if token.count(".") == 2:
+        # Signed token: everything needed is in the claims, no database lookup
+        claims = decode_token(token, "access")
+        return User(
+            id=claims["sub"],
+            email=claims["email"],
+            name=claims["name"],
+            role=claims["role"],
+            password_hash="",
+        )
+
+    if not ALLOW_LEGACY_TOKENS:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Legacy token (raw user id)
+    cached_user = user_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
     user = await db.users.find_one({"id": token})
     if not user:
         raise HTTPException(
@@ -232,7 +1081,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return User(**user)
+    current_user = User(**user)
+    user_cache.set(token, current_user)
+    return current_user
 
 # Admin only middleware
 async def admin_only(current_user: User = Depends(get_current_user)):
@@ -243,9 +1094,1210 @@ async def admin_only(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
+# Keyset pagination
+# Cursors are opaque base64 tokens holding the (sort value, id) of the last
+# item returned; the next page starts strictly after that pair.
+def encode_cursor(value: datetime, item_id: str) -> str:
+    raw = json.dumps({"v": value.isoformat(), "id": item_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["v"]), raw["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def paginate(
+    collection,
+    query: Dict[str, Any],
+    response: Response,
+    sort_field: str = "created_at",
+    direction: int = DESCENDING,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    sort = [(sort_field, direction), ("id", direction)]
+    if projection:
+        # The cursor needs the sort key of the last item
+        projection = {**projection, sort_field: 1, "id": 1}
+
+    if limit is None and cursor is None and LEGACY_UNPAGINATED_LISTS:
+        return await collection.find(query, projection).sort(sort).to_list(None)
+
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        op = "$lt" if direction == DESCENDING else "$gt"
+        query = {"$and": [query, {"$or": [
+            {sort_field: {op: value}},
+            {sort_field: value, "id": {op: last_id}},
+        ]}]}
+
+    # Fetch one extra document to know whether another page exists
+    items = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(None)
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(items[-1][sort_field], items[-1]["id"])
+    return items
+
+# Attachment blob stores
+# Both backends take an async iterator of byte chunks, hash while writing and
+# return (storage_key, sha256, size). Readers expose async read() and sync
+# seek()/close(), mirroring motor's GridOut.
+class GridFSBlobStore:
+    def __init__(self, database):
+        self.bucket = AsyncIOMotorGridFSBucket(database, bucket_name="attachment_blobs")
+
+    async def write(self, chunks: AsyncIterator[bytes], filename: str):
+        digest = hashlib.sha256()
+        size = 0
+        grid_in = self.bucket.open_upload_stream(filename)
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await grid_in.write(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        return str(grid_in._id), digest.hexdigest(), size
+
+    async def open(self, storage_key: str):
+        return await self.bucket.open_download_stream(ObjectId(storage_key))
+
+    async def delete(self, storage_key: str):
+        await self.bucket.delete(ObjectId(storage_key))
+
+class FileReader:
+    def __init__(self, handle):
+        self.handle = handle
+
+    async def read(self, size: int = -1) -> bytes:
+        return await asyncio.to_thread(self.handle.read, size)
+
+    def seek(self, pos: int):
+        self.handle.seek(pos)
+
+    def close(self):
+        self.handle.close()
+
+class FilesystemBlobStore:
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, storage_key: str) -> Path:
+        return self.root / storage_key[:2] / storage_key
+
+    async def write(self, chunks: AsyncIterator[bytes], filename: str):
+        digest = hashlib.sha256()
+        size = 0
+        tmp_dir = self.root / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        tmp_path = tmp_dir / str(uuid.uuid4())
+        handle = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(handle.write, chunk)
+        except BaseException:
+            handle.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        handle.close()
+
+        # Content addressed: identical files share one blob
+        storage_key = digest.hexdigest()
+        path = self._path(storage_key)
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        await asyncio.to_thread(os.replace, tmp_path, path)
+        return storage_key, storage_key, size
+
+    async def open(self, storage_key: str):
+        return FileReader(await asyncio.to_thread(open, self._path(storage_key), "rb"))
+
+    async def delete(self, storage_key: str):
+        self._path(storage_key).unlink(missing_ok=True)
+
+if ATTACHMENT_STORAGE == "filesystem":
+    blob_store = FilesystemBlobStore(ATTACHMENT_DIR)
+else:
+    blob_store = GridFSBlobStore(db)
+
+async def store_attachment(chunks: AsyncIterator[bytes], filename: str, content_type: str, uploaded_by: str) -> Attachment:
+    storage_key, sha256, size = await blob_store.write(chunks, filename)
+
+    # Reuse an existing blob with the same content
+    duplicate = await db.attachments.find_one({"sha256": sha256, "storage_key": {"$ne": storage_key}}, {"_id": 0, "storage_key": 1})
+    if duplicate:
+        await blob_store.delete(storage_key)
+        storage_key = duplicate["storage_key"]
+
+    attachment = Attachment(
+        filename=filename,
+        content_type=content_type or "application/octet-stream",
+        size=size,
+        sha256=sha256,
+        storage_key=storage_key,
+        uploaded_by=uploaded_by,
+    )
+    await db.attachments.insert_one(attachment.dict())
+    return attachment
+
+async def limit_upload_size(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    # Counts bytes as they pass through so oversized uploads fail without buffering
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File exceeds the {max_bytes} byte upload limit"
+            )
+        yield chunk
+
+def check_content_length(request: Request):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit"
+        )
+
+async def store_base64_attachment(value: str, uploaded_by: str, filename: str, strict: bool = True) -> Attachment:
+    content_type = "application/octet-stream"
+    data = value
+    if value.startswith("data:") and "," in value:
+        # data:<content type>;base64,<payload>
+        header, data = value.split(",", 1)
+        content_type = header[len("data:"):].split(";")[0] or content_type
+    # Same cap as streamed uploads, judged from the encoded length so an
+    # oversized payload is never decoded
+    if strict and len(data) // 4 * 3 - 2 > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit"
+        )
+    try:
+        content = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        if strict:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid attachment"
+            )
+        # Keep whatever was stored rather than losing it
+        content, content_type = value.encode(), "text/plain"
+
+    async def chunks():
+        yield content
+
+    if strict:
+        return await store_attachment(limit_upload_size(chunks(), MAX_UPLOAD_BYTES), filename, content_type, uploaded_by)
+    return await store_attachment(chunks(), filename, content_type, uploaded_by)
+
+async def resolve_attachments(values: List[str], current_user: User, allowed_ids: Optional[set] = None) -> List[Dict[str, Any]]:
+    # Values are attachment ids; anything else is treated as legacy base64 content
+    allowed_ids = allowed_ids or set()
+    found = {
+        attachment["id"]: attachment
+        async for attachment in db.attachments.find({"id": {"$in": values}}, {"_id": 0})
+    }
+    refs = []
+    for index, value in enumerate(values):
+        attachment = found.get(value)
+        if attachment is None:
+            attachment = (await store_base64_attachment(value, current_user.id, f"attachment-{index + 1}")).dict()
+        elif attachment["uploaded_by"] != current_user.id and current_user.role != "admin" and value not in allowed_ids:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        refs.append(AttachmentRef(**attachment).dict())
+    return refs
+
+async def discard_attachments(attachments: List[Attachment]):
+    # Removes attachment records nothing refers to, and their blobs unless
+    # another record shares the content
+    await db.attachments.delete_many({"id": {"$in": [attachment.id for attachment in attachments]}})
+    for storage_key in {attachment.storage_key for attachment in attachments}:
+        if not await db.attachments.find_one({"storage_key": storage_key}, {"_id": 1}):
+            await blob_store.delete(storage_key)
+
+async def migrate_embedded_attachments() -> int:
+    # Moves base64 strings embedded in essay_requests into the attachment store
+    migrated = 0
+    cursor = db.essay_requests.find(
+        {"attachments": {"$type": "string"}},
+        {"_id": 0, "id": 1, "student_id": 1, "attachments": 1}
+    )
+    async for request in cursor:
+        refs = []
+        created = []
+        for index, value in enumerate(request["attachments"]):
+            if isinstance(value, str):
+                attachment = await store_base64_attachment(
+                    value, request["student_id"], f"attachment-{index + 1}", strict=False
+                )
+                created.append(attachment)
+                value = AttachmentRef(**attachment.dict()).dict()
+            refs.append(value)
+        # Compare-and-set: another worker may have migrated (or the student
+        # edited) this request in the meantime
+        result = await db.essay_requests.update_one(
+            {"id": request["id"], "attachments": request["attachments"]},
+            {"$set": {"attachments": refs}}
+        )
+        if not result.matched_count:
+            await discard_attachments(created)
+            continue
+        migrated += 1
+    if migrated:
+        logger.info(f"Moved embedded attachments out of {migrated} essay requests")
+    return migrated
+
+# Text search
+# Mongo has no Greek stemmer, so Greek text is indexed and searched with the
+# "none" language (tokenised, diacritic-insensitive, unstemmed). Each request
+# stores the language its text was indexed with in search_language.
+GREEK_PATTERN = re.compile(r"[\u0370-\u03ff\u1f00-\u1fff]")
+
+def search_language(text: str) -> str:
+    return "none" if GREEK_PATTERN.search(text or "") else "english"
+
+def request_search_language(request_data: Dict[str, Any]) -> str:
+    return search_language(" ".join([request_data.get("title") or "", request_data.get("extra_information") or ""]))
+
+async def text_search(
+    collection,
+    query: Dict[str, Any],
+    search: str,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    # Relevance scores aren't filterable, so text results page by offset
+    query = {**query, "$text": {"$search": search, "$language": search_language(search)}}
+    projection = {**(projection or {}), "score": {"$meta": "textScore"}}
+    find = collection.find(query, projection).sort([
+        ("score", {"$meta": "textScore"}),
+        ("created_at", DESCENDING),
+        ("id", DESCENDING),
+    ])
+
+    if limit is None and cursor is None and LEGACY_UNPAGINATED_LISTS:
+        items = await find.to_list(None)
+    else:
+        offset = 0
+        if cursor:
+            try:
+                offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+            except (ValueError, KeyError, TypeError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor"
+                )
+        limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        items = await find.skip(offset).limit(limit + 1).to_list(None)
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = json.dumps({"offset": offset + limit})
+            response.headers["X-Next-Cursor"] = base64.urlsafe_b64encode(next_cursor.encode()).decode()
+
+    for item in items:
+        item.pop("score", None)
+    return items
+
+# Materialized categories
+# db.categories holds one document per field_of_study with the number of
+# requests using it, kept up to date by the request handlers. Reads are served
+# from memory and reloaded after local writes or every CATEGORIES_CACHE_SECONDS
+# so other workers' changes show up.
+class CategoryCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.counts: Dict[str, int] = {}
+        self.etag = ""
+        self.loaded_at: Optional[float] = None
+
+    async def get(self) -> Dict[str, int]:
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl_seconds:
+            await self.reload()
+        return self.counts
+
+    async def reload(self):
+        counts = {}
+        async for category in db.categories.find({"count": {"$gt": 0}}, {"_id": 0}).sort("name", ASCENDING):
+            counts[category["name"]] = category["count"]
+        self.counts = counts
+        self.etag = '"' + hashlib.sha256(json.dumps(counts, sort_keys=True).encode()).hexdigest()[:32] + '"'
+        self.loaded_at = time.monotonic()
+
+    async def adjust(self, name: Optional[str], delta: int):
+        if not name:
+            return
+        await db.categories.update_one({"name": name}, {"$inc": {"count": delta}}, upsert=True)
+        if delta < 0:
+            await db.categories.delete_many({"name": name, "count": {"$lte": 0}})
+        self.loaded_at = None
+
+    async def rebuild(self) -> Dict[str, int]:
+        counts = {}
+        pipeline = [{"$group": {"_id": "$field_of_study", "count": {"$sum": 1}}}]
+        async for group in db.essay_requests.aggregate(pipeline):
+            if group["_id"]:
+                counts[group["_id"]] = group["count"]
+        for name, count in counts.items():
+            await db.categories.update_one({"name": name}, {"$set": {"count": count}}, upsert=True)
+        await db.categories.delete_many({"name": {"$nin": list(counts)}})
+        await self.reload()
+        return self.counts
+
+category_cache = CategoryCache(CATEGORIES_CACHE_SECONDS)
+
+# Settings cache
+# Each settings collection has exactly one document marked singleton=True,
+# created with an atomic upsert (backed by a unique partial index) so
+# concurrent cold starts can't insert duplicates. Every update bumps a version
+# counter; a background task compares versions and reloads when another
+# worker has changed the settings.
+class SettingsCache:
+    def __init__(self, collection_name: str, model, on_change=None):
+        self.collection_name = collection_name
+        self.model = model
+        self.on_change = on_change
+        self.value = None
+        self.version: Optional[int] = None
+
+    @property
+    def collection(self):
+        return db[self.collection_name]
+
+    async def load(self):
+        # Adopt the most recently updated document from before the singleton marker
+        if not await self.collection.find_one({"singleton": True}, {"_id": 1}):
+            legacy = await self.collection.find_one(
+                {"singleton": {"$exists": False}}, {"_id": 1}, sort=[("updated_at", DESCENDING)]
+            )
+            if legacy:
+                await self.collection.update_one(
+                    {"_id": legacy["_id"], "singleton": {"$exists": False}},
+                    {"$set": {"singleton": True, "version": 0}}
+                )
+
+        settings = await self.collection.find_one_and_update(
+            {"singleton": True},
+            {"$setOnInsert": {**self.model().dict(), "version": 0}},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        self._set(settings)
+
+    async def get(self):
+        if self.value is None:
+            await self.load()
+        return self.value
+
+    async def update(self, update_data: Dict[str, Any]):
+        if self.value is None:
+            await self.load()
+        settings = await self.collection.find_one_and_update(
+            {"singleton": True},
+            {"$set": update_data, "$inc": {"version": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        self._set(settings)
+        return self.value
+
+    async def sync(self):
+        current = await self.collection.find_one({"singleton": True}, {"_id": 0, "version": 1})
+        if current is None or current.get("version") != self.version:
+            await self.load()
+
+    def _set(self, settings: Dict[str, Any]):
+        self.version = settings.get("version", 0)
+        self.value = self.model(**settings)
+        if self.on_change:
+            self.on_change(self.value)
+
+# Public branding snapshot
+# Serialized once per settings change so the unauthenticated endpoint only
+# writes out bytes.
+class BrandingSnapshot:
+    def __init__(self):
+        self.body = b""
+        self.etag = ""
+
+    def rebuild(self, settings: SystemSettings):
+        branding = jsonable_encoder(settings.dict(exclude={"id"}))
+        self.body = json.dumps(branding, sort_keys=True, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest() + '"'
+
+branding_snapshot = BrandingSnapshot()
+
+admin_settings_cache = SettingsCache("admin_settings", AdminSettings)
+system_settings_cache = SettingsCache("system_settings", SystemSettings, on_change=branding_snapshot.rebuild)
+
+async def sync_settings():
+    while True:
+        await asyncio.sleep(SETTINGS_SYNC_SECONDS)
+        for cache in (admin_settings_cache, system_settings_cache):
+            try:
+                await cache.sync()
+            except Exception as e:
+                logger.error(f"Failed to sync {cache.collection_name}: {e}")
+
+# In-process pub/sub
+# Topic -> subscriber queues, used to push events to open WebSocket/SSE
+# connections. Only reaches connections held by this worker process.
+PUBSUB_QUEUE_SIZE = 1000
+
+class PubSub:
+    def __init__(self, name: str):
+        self.name = name
+        self.topics: Dict[str, set] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=PUBSUB_QUEUE_SIZE)
+        self.topics.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.topics[topic]
+
+    def publish(self, topic: str, payload: Any):
+        for queue in self.topics.get(topic, ()):
+            try:
+                queue.put_nowait(payload)
+                self.published += 1
+            except asyncio.QueueFull:
+                # Slow consumer; it can catch up by resuming from its last-seen timestamp
+                self.dropped += 1
+                logger.warning(f"{self.name} subscriber on {topic} is full, dropping event")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self.topics),
+            "subscribers": sum(len(subscribers) for subscribers in self.topics.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+chat_hub = PubSub("chat")
+notification_hub = PubSub("notifications")
+
+# Notification fan-out
+async def insert_notifications(notifications: List[Dict[str, Any]], session=None, publish: bool = True):
+    # Unordered so one bad document doesn't stop the rest of the batch. Callers
+    # writing inside a transaction pass publish=False and publish after commit.
+    if notifications:
+        await db.notifications.insert_many(notifications, ordered=False, session=session)
+        await adjust_unread_counters(notifications, session=session)
+        if publish:
+            publish_notifications(notifications)
+
+def publish_notifications(notifications: List[Dict[str, Any]]):
+    for notification in notifications:
+        notification_hub.publish(notification["user_id"], Notification(**notification))
+
+# Unread counters
+# db.notification_counters keeps one unread count per user, adjusted on every
+# notification write and periodically recomputed to correct any drift.
+async def adjust_unread_counters(notifications: List[Dict[str, Any]], session=None):
+    increments: Dict[str, int] = {}
+    for notification in notifications:
+        if not notification.get("read"):
+            increments[notification["user_id"]] = increments.get(notification["user_id"], 0) + 1
+    if increments:
+        await db.notification_counters.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$inc": {"unread": count}}, upsert=True)
+            for user_id, count in increments.items()
+        ], ordered=False, session=session)
+
+async def decrement_unread_counter(user_id: str, count: int):
+    if count:
+        await db.notification_counters.update_one({"user_id": user_id}, {"$inc": {"unread": -count}}, upsert=True)
+
+async def reconcile_unread_counters() -> int:
+    # Users with unread notifications come from the (read, created_at) index,
+    # plus everyone who already has a counter
+    user_ids = set(await db.notifications.distinct("user_id", {"read": False}))
+    user_ids.update(await db.notification_counters.distinct("user_id"))
+
+    corrected = 0
+    for user_id in user_ids:
+        # Read the counter before counting, then compare-and-set: if any
+        # increment or decrement lands in between, the counter no longer
+        # matches and the correction is skipped until the next run
+        counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0, "unread": 1})
+        observed = counter.get("unread") if counter else None
+        expected = await db.notifications.count_documents({"user_id": user_id, "read": False})
+        if observed == expected:
+            continue
+        if counter is None:
+            try:
+                result = await db.notification_counters.update_one(
+                    {"user_id": user_id, "unread": {"$exists": False}},
+                    {"$set": {"unread": expected}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                # Created by a concurrent write; leave it to the next run
+                continue
+        else:
+            result = await db.notification_counters.update_one(
+                {"user_id": user_id, "unread": observed},
+                {"$set": {"unread": expected}},
+            )
+        if result.modified_count or result.upserted_id is not None:
+            corrected += 1
+    if corrected:
+        logger.info(f"Reconciled {corrected} unread notification counters")
+    return corrected
+
+# Notification archival
+# Copies read notifications past the retention period to the archive, then
+# flags them archived so the TTL index can remove them.
+async def ensure_notification_archive():
+    # Compression is fixed at creation, so this has to run before anything
+    # (index reconciliation included) implicitly creates the collection
+    if NOTIFICATION_ARCHIVE != "collection":
+        return
+    cursor = await db.list_collections(filter={"name": "notifications_archive"})
+    existing = await cursor.to_list(None)
+    if existing:
+        config = existing[0].get("options", {}).get("storageEngine", {}).get("wiredTiger", {}).get("configString", "")
+        if "block_compressor=zstd" in config:
+            return
+        if await db.notifications_archive.estimated_document_count() > 0:
+            logger.warning("notifications_archive exists without zstd compression; recreate it to compress the archive")
+            return
+        # Created empty with the default compressor, e.g. by an earlier index build
+        await db.drop_collection("notifications_archive")
+    try:
+        await db.create_collection(
+            "notifications_archive",
+            storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+        )
+    except CollectionInvalid:
+        # Another worker created it first
+        pass
+
+def append_ndjson_archive(path: Path, notifications: List[Dict[str, Any]]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Appending creates a new gzip member, which readers handle transparently
+    with gzip.open(path, "at", encoding="utf-8") as archive:
+        for notification in notifications:
+            archive.write(json.dumps(jsonable_encoder(notification)) + "\n")
+
+async def archive_notifications() -> int:
+    if NOTIFICATION_RETENTION_DAYS <= 0 or NOTIFICATION_ARCHIVE == "none":
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    archived = 0
+    while True:
+        batch = await db.notifications.find(
+            {"read": True, "archived": {"$ne": True}, "created_at": {"$lt": cutoff}},
+            {"_id": 0}
+        ).limit(NOTIFICATION_ARCHIVE_BATCH_SIZE).to_list(None)
+        if not batch:
+            break
+        if NOTIFICATION_ARCHIVE == "ndjson":
+            path = NOTIFICATION_ARCHIVE_DIR / f"notifications-{datetime.utcnow():%Y%m%d}.ndjson.gz"
+            await asyncio.to_thread(append_ndjson_archive, path, batch)
+        else:
+            # Keyed by id so a retried batch doesn't duplicate entries
+            await db.notifications_archive.bulk_write([
+                UpdateOne({"id": notification["id"]}, {"$setOnInsert": notification}, upsert=True)
+                for notification in batch
+            ], ordered=False)
+        await db.notifications.update_many(
+            {"id": {"$in": [notification["id"] for notification in batch]}},
+            {"$set": {"archived": True}}
+        )
+        archived += len(batch)
+    if archived:
+        logger.info(f"Archived {archived} notifications")
+    return archived
+
+async def archive_notifications_periodically():
+    while True:
+        try:
+            await archive_notifications()
+        except Exception as e:
+            logger.error(f"Failed to archive notifications: {e}")
+        await asyncio.sleep(NOTIFICATION_ARCHIVE_INTERVAL_SECONDS)
+
+async def reconcile_unread_counters_periodically():
+    while True:
+        try:
+            await reconcile_unread_counters()
+        except Exception as e:
+            logger.error(f"Failed to reconcile unread counters: {e}")
+        await asyncio.sleep(UNREAD_RECONCILE_SECONDS)
+
+async def write_role_notifications(role: str, title: str, message: str, type: str) -> int:
+    # Streams user ids for the role and writes notifications in chunks,
+    # instead of one insert_one round trip per recipient
+    chunk_size = max(NOTIFICATION_FANOUT_CHUNK_SIZE, 1)
+    cursor = db.users.find({"role": role}, {"_id": 0, "id": 1}).batch_size(chunk_size)
+    batch = []
+    sent = 0
+    async for user in cursor:
+        batch.append(Notification(user_id=user["id"], title=title, message=message, type=type).dict())
+        if len(batch) >= chunk_size:
+            await insert_notifications(batch)
+            sent += len(batch)
+            batch = []
+    await insert_notifications(batch)
+    return sent + len(batch)
+
+# Notification outbox
+# Handlers enqueue notification intents and return immediately; a single
+# worker started on app startup drains the queue in batches. When the queue is
+# full, enqueue waits up to NOTIFICATION_ENQUEUE_TIMEOUT_SECONDS and then
+# writes inline so nothing is dropped.
+class NotificationDispatcher:
+    def __init__(self, max_size: int, batch_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.batch_size = max(batch_size, 1)
+        self.worker: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.max_depth = 0
+        self.last_drain_lag = 0.0
+        self.max_drain_lag = 0.0
+
+    async def enqueue(self, notification: Notification):
+        await self._put(("user", notification.dict()))
+
+    async def enqueue_role(self, role: str, title: str, message: str, type: str):
+        await self._put(("role", {"role": role, "title": title, "message": message, "type": type}))
+
+    async def _put(self, intent: tuple):
+        item = (time.monotonic(), intent)
+        try:
+            await asyncio.wait_for(self.queue.put(item), NOTIFICATION_ENQUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Backpressure: queue stayed full, write from the handler instead
+            self.inline_writes += 1
+            await self._deliver([item])
+            return
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _deliver(self, items: List[tuple]):
+        notifications = []
+        for enqueued_at, (kind, payload) in items:
+            try:
+                if kind == "role":
+                    self.delivered += await write_role_notifications(**payload)
+                else:
+                    notifications.append(payload)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to fan out {payload['type']} notification to {payload['role']}: {e}")
+        try:
+            await insert_notifications(notifications)
+            self.delivered += len(notifications)
+        except Exception as e:
+            self.failed += len(notifications)
+            logger.error(f"Failed to write {len(notifications)} notifications: {e}")
+
+        lag = time.monotonic() - items[0][0]
+        self.last_drain_lag = lag
+        self.max_drain_lag = max(self.max_drain_lag, lag)
+        self.batches += 1
+
+    async def run(self):
+        while True:
+            items = [await self.queue.get()]
+            while len(items) < self.batch_size and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            try:
+                await self._deliver(items)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def start(self):
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), NOTIFICATION_FLUSH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"Notification queue not drained on shutdown, {self.queue.qsize()} intents lost")
+        self.worker.cancel()
+        self.worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.worker is not None,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "batches": self.batches,
+            "inline_writes": self.inline_writes,
+            "last_drain_lag_seconds": self.last_drain_lag,
+            "max_drain_lag_seconds": self.max_drain_lag,
+        }
+
+notification_dispatcher = NotificationDispatcher(NOTIFICATION_QUEUE_SIZE, NOTIFICATION_BATCH_SIZE)
+
+# Request permissions
+def check_request_access(request: Dict[str, Any], current_user: User):
+    # Students see their own requests, supervisors see pending ones and their assignments
+    if current_user.role == "student" and request["student_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    elif current_user.role == "supervisor" and request["status"] != "pending" and request.get("assigned_supervisor") != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+# Essay request projections
+def essay_request_projection(view: str, fields: Optional[str]) -> Optional[List[str]]:
+    # None means the full EssayRequest document
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in EssayRequest.model_fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+        return ["id"] + [field for field in requested if field != "id"]
+    if view == "summary":
+        return list(EssayRequestSummary.model_fields)
+    if view != "full":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="view must be 'full' or 'summary'"
+        )
+    return None
+
+def projected_essay_requests(
+    requests: List[Dict[str, Any]],
+    view: str,
+    fields: Optional[List[str]],
+    response: Optional[Response] = None,
+    bid_summaries: Optional[Dict[str, BidSummary]] = None,
+):
+    if fields is None and bid_summaries is None:
+        return [EssayRequest(**request) for request in requests]
+    if fields is None:
+        items = [EssayRequest(**request) for request in requests]
+    elif view == "summary" and fields == list(EssayRequestSummary.model_fields):
+        items = [EssayRequestSummary(**request) for request in requests]
+    else:
+        items = [{field: request.get(field) for field in fields} for request in requests]
+    items = jsonable_encoder(items)
+    if bid_summaries is not None:
+        for item in items:
+            item["bid_summary"] = jsonable_encoder(bid_summaries[item["id"]])
+    # Bypass the full response_model, which would demand every field
+    headers = {}
+    if response is not None and "X-Next-Cursor" in response.headers:
+        headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+    return JSONResponse(items, headers=headers)
+
+def check_chat_access(request: Dict[str, Any], current_user: User):
+    # Chat is limited to the request's student, its assigned supervisor and admins
+    if current_user.role == "student" and request["student_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    elif current_user.role == "supervisor" and request.get("assigned_supervisor") != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+def chat_messages_query(
+    request_id: str,
+    is_admin: bool,
+    since: Optional[datetime] = None,
+    since_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    # Admins see every message, everyone else only approved ones. Deltas page
+    # on (visible_at, id), which also picks up old messages approved late.
+    query = {"request_id": request_id}
+    if not is_admin:
+        query["approved"] = True
+    if since is not None:
+        if since.tzinfo:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        if since_id:
+            query["$or"] = [{"visible_at": {"$gt": since}}, {"visible_at": since, "id": {"$gt": since_id}}]
+        else:
+            query["visible_at"] = {"$gt": since}
+    return query
+
+async def backfill_chat_visible_at():
+    # Messages written before visible_at existed; only needed until the
+    # visible_at indexes have been built
+    indexes = await db.chat_messages.index_information()
+    if "request_id_approved_visible_at_id" in indexes:
+        return
+    result = await db.chat_messages.update_many(
+        {"visible_at": {"$exists": False}},
+        [{"$set": {"visible_at": {"$ifNull": ["$approved_at", "$timestamp"]}}}],
+    )
+    if result.modified_count:
+        logger.info(f"Backfilled visible_at on {result.modified_count} chat messages")
+
+# Bid summaries
+# db.bid_summaries holds one document per request with running totals that
+# the bid handlers update in the same write as the bid. Prices are kept as a
+# sorted array (one entry per bid) for the median, and supervisor ids as a map
+# of bid counts for the distinct count.
+def bid_summary_insert_update(bid: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "$inc": {
+            "count": 1,
+            "total": bid["price"],
+            f"supervisors.{bid['supervisor_id']}": 1,
+            f"status_counts.{bid['status']}": 1,
+        },
+        "$min": {"min_price": bid["price"]},
+        "$max": {"max_price": bid["price"], "latest_bid_at": bid["created_at"]},
+        "$push": {"prices": {"$each": [bid["price"]], "$sort": 1}},
+    }
+
+def bid_summary_from_doc(request_id: str, doc: Optional[Dict[str, Any]]) -> BidSummary:
+    if not doc or not doc.get("count"):
+        return BidSummary(request_id=request_id)
+    prices = doc.get("prices", [])
+    middle = len(prices) // 2
+    if not prices:
+        median = None
+    elif len(prices) % 2:
+        median = prices[middle]
+    else:
+        median = (prices[middle - 1] + prices[middle]) / 2
+    return BidSummary(
+        request_id=request_id,
+        count=doc["count"],
+        min_price=doc.get("min_price"),
+        max_price=doc.get("max_price"),
+        mean_price=doc["total"] / doc["count"],
+        median_price=median,
+        latest_bid_at=doc.get("latest_bid_at"),
+        distinct_supervisors=sum(1 for count in doc.get("supervisors", {}).values() if count > 0),
+        status_counts={name: count for name, count in doc.get("status_counts", {}).items() if count > 0},
+    )
+
+async def record_bid_summary(bid: Dict[str, Any]):
+    await db.bid_summaries.update_one(
+        {"request_id": bid["request_id"]},
+        bid_summary_insert_update(bid),
+        upsert=True,
+    )
+
+async def record_bid_status_change(request_id: str, old_status: str, new_status: str):
+    if old_status != new_status:
+        await db.bid_summaries.update_one(
+            {"request_id": request_id},
+            {"$inc": {f"status_counts.{old_status}": -1, f"status_counts.{new_status}": 1}},
+        )
+
+async def get_bid_summaries(request_ids: List[str]) -> Dict[str, BidSummary]:
+    docs = {}
+    async for doc in db.bid_summaries.find({"request_id": {"$in": request_ids}}, {"_id": 0}):
+        docs[doc["request_id"]] = doc
+    return {request_id: bid_summary_from_doc(request_id, docs.get(request_id)) for request_id in request_ids}
+
+async def rebuild_bid_summaries(request_id: Optional[str] = None) -> int:
+    # Recomputes summaries from db.bids, for the first deploy or after drift
+    match = {"request_id": request_id} if request_id else {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$request_id",
+            "count": {"$sum": 1},
+            "total": {"$sum": "$price"},
+            "min_price": {"$min": "$price"},
+            "max_price": {"$max": "$price"},
+            "latest_bid_at": {"$max": "$created_at"},
+            "prices": {"$push": "$price"},
+            "supervisor_ids": {"$push": "$supervisor_id"},
+            "statuses": {"$push": "$status"},
+        }},
+    ]
+    rebuilt = []
+    async for group in db.bids.aggregate(pipeline):
+        supervisors: Dict[str, int] = {}
+        for supervisor_id in group.pop("supervisor_ids"):
+            supervisors[supervisor_id] = supervisors.get(supervisor_id, 0) + 1
+        status_counts: Dict[str, int] = {}
+        for status_value in group.pop("statuses"):
+            status_counts[status_value] = status_counts.get(status_value, 0) + 1
+        request_key = group.pop("_id")
+        summary = {
+            **group,
+            "request_id": request_key,
+            "prices": sorted(group["prices"]),
+            "supervisors": supervisors,
+            "status_counts": status_counts,
+        }
+        await db.bid_summaries.replace_one({"request_id": summary["request_id"]}, summary, upsert=True)
+        rebuilt.append(summary["request_id"])
+
+    # Drop summaries whose request no longer has any bids
+    stale = {"request_id": {"$nin": rebuilt}}
+    if request_id:
+        stale["request_id"]["$eq"] = request_id
+    await db.bid_summaries.delete_many(stale)
+    return len(rebuilt)
+
+# Duplicate bids
+# Older data may hold several bids from the same supervisor on one request.
+# Each group keeps its accepted bid, else one referenced by a payment, else
+# the most recent one. Payments pointing at a removed bid are moved to the
+# kept one and the affected summaries are rebuilt.
+async def collapse_duplicate_bids() -> Dict[str, int]:
+    pipeline = [
+        {"$sort": {"created_at": DESCENDING}},
+        {"$group": {
+            "_id": {"request_id": "$request_id", "supervisor_id": "$supervisor_id"},
+            "bids": {"$push": {"id": "$id", "status": "$status"}},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    groups = 0
+    removed = 0
+    request_ids = set()
+    async for group in db.bids.aggregate(pipeline, allowDiskUse=True):
+        bids = group["bids"]
+        ids = [bid["id"] for bid in bids]
+        paid = {payment["bid_id"] async for payment in db.payment_info.find({"bid_id": {"$in": ids}}, {"_id": 0, "bid_id": 1})}
+        keep = (
+            next((bid for bid in bids if bid["status"] == "accepted"), None)
+            or next((bid for bid in bids if bid["id"] in paid), None)
+            or bids[0]
+        )
+        duplicates = [bid_id for bid_id in ids if bid_id != keep["id"]]
+        logger.warning(
+            f"Collapsing bids of supervisor {group['_id']['supervisor_id']} on request "
+            f"{group['_id']['request_id']}: keeping {keep['id']}, deleting {duplicates}"
+        )
+        if paid.intersection(duplicates):
+            await db.payment_info.update_many({"bid_id": {"$in": duplicates}}, {"$set": {"bid_id": keep["id"]}})
+        result = await db.bids.delete_many({"id": {"$in": duplicates}})
+        groups += 1
+        removed += result.deleted_count
+        request_ids.add(group["_id"]["request_id"])
+
+    for request_id in request_ids:
+        await rebuild_bid_summaries(request_id)
+    if removed:
+        logger.info(f"Collapsed {groups} duplicate bid groups, removed {removed} bids")
+    return {"groups": groups, "removed": removed}
+
+async def upsert_bid(bid: Bid) -> Optional[Dict[str, Any]]:
+    """Inserts the bid or replaces the supervisor's pending one; returns the replaced bid, if any."""
+    doc = bid.dict()
+    # Only a pending bid may be replaced, so a re-bid can't undo an acceptance
+    # or revive a rejection. created_at is left alone: /api/bids pages on it.
+    update = {
+        "$set": {"price": doc["price"], "notes": doc["notes"]},
+        "$setOnInsert": {key: doc[key] for key in ["id", "status", "created_at"]},
+    }
+    key = {"request_id": bid.request_id, "supervisor_id": bid.supervisor_id, "status": "pending"}
+    try:
+        previous = await db.bids.find_one_and_update(key, update, projection={"_id": 0}, upsert=True)
+    except DuplicateKeyError:
+        # Either the existing bid has been decided, or a concurrent bid from
+        # the same supervisor was inserted first and can still be replaced
+        previous = await db.bids.find_one_and_update(key, update, projection={"_id": 0})
+        if not previous:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Bid already decided"
+            )
+    if previous:
+        # Keep the existing id so references to the bid stay valid
+        bid.id = previous["id"]
+        bid.created_at = previous["created_at"]
+    return previous
+
+# Bid acceptance
+# Accepting a bid flips the request from pending to accepted with a guarded
+# find_one_and_update, so of two concurrent acceptances only one can win. The
+# bid, request, sibling rejection and supervisor notification are written in
+# one transaction; write conflicts are retried by with_transaction.
+class BidAcceptanceConflict(Exception):
+    pass
+
+class BidAcceptanceMetrics:
+    def __init__(self, max_samples: int):
+        self.latencies: deque = deque(maxlen=max_samples)
+        self.accepted = 0
+        self.conflicts = 0
+        self.attempts = 0
+        self.retries = 0
+        self.transactional = 0
+        self.non_transactional = 0
+
+    def record(self, started: float):
+        self.latencies.append(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "accepted": self.accepted,
+            "conflicts": self.conflicts,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "transactional": self.transactional,
+            "non_transactional": self.non_transactional,
+            "transactions_supported": transactions_supported,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "samples": len(latencies)},
+        }
+
+bid_acceptance_metrics = BidAcceptanceMetrics(BID_ACCEPT_LATENCY_SAMPLES)
+
+# None until the first acceptance finds out whether the server has transactions
+transactions_supported: Optional[bool] = {"true": True, "false": False}.get(BID_ACCEPT_TRANSACTIONS)
+
+def transactions_unavailable(error: OperationFailure) -> bool:
+    # IllegalOperation from a standalone mongod
+    return error.code == 20 or "Transaction numbers are only allowed" in str(error)
+
+async def write_bid_acceptance(bid_id: str, session=None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    bid_acceptance_metrics.attempts += 1
+    bid = await db.bids.find_one_and_update(
+        {"id": bid_id},
+        {"$set": {"status": "accepted"}},
+        projection={"_id": 0},
+        session=session,
+    )
+    if not bid:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Bid not found"
+        )
+    
+    request = await db.essay_requests.find_one_and_update(
+        {"id": bid["request_id"], "status": "pending"},
+        {"$set": {"status": "accepted", "assigned_supervisor": bid["supervisor_id"]}},
+        projection={"_id": 1},
+        session=session,
+    )
+    if not request:
+        raise BidAcceptanceConflict(bid)
+    
+    siblings = await db.bids.update_many(
+        {"request_id": bid["request_id"], "id": {"$ne": bid_id}},
+        {"$set": {"status": "rejected"}},
+        session=session,
+    )
+    # Every bid on the request is now decided
+    await db.bid_summaries.update_one(
+        {"request_id": bid["request_id"]},
+        {"$set": {"status_counts": {"accepted": 1, "rejected": siblings.matched_count}}},
+        session=session,
+    )
+    
+    notifications = [Notification(
+        user_id=bid["supervisor_id"],
+        title="Bid Status Updated",
+        message="Your bid has been accepted",
+        type="bid_status_update"
+    ).dict()]
+    await insert_notifications(notifications, session=session, publish=False)
+    return bid, notifications
+
+async def accept_bid(bid_id: str) -> Dict[str, Any]:
+    global transactions_supported
+    started = time.perf_counter()
+    try:
+        if transactions_supported is not False:
+            try:
+                attempts = 0
+
+                async def callback(session):
+                    nonlocal attempts
+                    attempts += 1
+                    if attempts > 1:
+                        bid_acceptance_metrics.retries += 1
+                    return await write_bid_acceptance(bid_id, session)
+
+                async with await client.start_session() as session:
+                    bid, notifications = await session.with_transaction(callback)
+                transactions_supported = True
+                bid_acceptance_metrics.transactional += 1
+            except OperationFailure as e:
+                if not transactions_unavailable(e) or BID_ACCEPT_TRANSACTIONS == "true":
+                    raise
+                logger.warning("Mongo transactions unavailable, accepting bids without them")
+                transactions_supported = False
+
+        if transactions_supported is False:
+            try:
+                bid, notifications = await write_bid_acceptance(bid_id)
+            except BidAcceptanceConflict as conflict:
+                # No transaction to abort: put the bid back as it was
+                previous = conflict.args[0]
+                await db.bids.update_one(
+                    {"id": bid_id, "status": "accepted"},
+                    {"$set": {"status": previous["status"]}}
+                )
+                raise
+            bid_acceptance_metrics.non_transactional += 1
+    except BidAcceptanceConflict:
+        bid_acceptance_metrics.conflicts += 1
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Request is no longer open for bid acceptance"
+        )
+    finally:
+        bid_acceptance_metrics.record(started)
+
+    bid_acceptance_metrics.accepted += 1
+    publish_notifications(notifications)
+    return bid
+
 # Routes
 @api_router.post("/auth/register")
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request):
+    await check_auth_rate_limit(request, "register", user_data.email)
+    
     # Check if user already exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
@@ -256,29 +2308,91 @@ async def register(user_data: UserCreate):
     
     # Create new user
     user_dict = user_data.dict()
-    user_dict["password_hash"] = hash_password(user_data.password)
+    user_dict["password_hash"] = await hash_password(user_data.password)
     del user_dict["password"]
     
     user = User(**user_dict)
     await db.users.insert_one(user.dict())
     
-    # Return token (user ID for simplicity)
-    return {"token": user.id, "user": {"id": user.id, "email": user.email, "name": user.name, "role": user.role}}
+    tokens = issue_tokens(user.id, user.email, user.name, user.role)
+    return {**tokens, "user": {"id": user.id, "email": user.email, "name": user.name, "role": user.role}}
 
 @api_router.post("/auth/login")
-async def login(login_data: UserLogin):
+async def login(login_data: UserLogin, request: Request):
+    await check_auth_rate_limit(request, "login", login_data.email)
+    
     user = await db.users.find_one({"email": login_data.email})
-    if not user or not verify_password(login_data.password, user["password_hash"]):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
-    return {"token": user["id"], "user": {"id": user["id"], "email": user["email"], "name": user["name"], "role": user["role"]}}
+    valid, new_hash = await verify_password(login_data.password, user.get("password_hash", ""))
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials"
+        )
+    
+    # Upgrade hashes made with an old scheme or cost; the filter keeps a
+    # concurrent password change from being overwritten
+    if new_hash:
+        await db.users.update_one(
+            {"id": user["id"], "password_hash": user["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    
+    # A successful login clears the per-email count so the owner isn't
+    # locked out by their own earlier typos
+    await auth_rate_limiter.reset(rate_limit_email_key("login", login_data.email))
+    
+    tokens = issue_tokens(user["id"], user["email"], user["name"], user["role"])
+    return {**tokens, "user": {"id": user["id"], "email": user["email"], "name": user["name"], "role": user["role"]}}
+
+@api_router.post("/auth/refresh")
+async def refresh_token(refresh_data: TokenRefresh):
+    claims = decode_token(refresh_data.refresh_token, "refresh")
+    
+    # Refresh tokens are single use: claim the jti before issuing anything.
+    # The unique index makes the claim atomic across requests and workers.
+    if not await token_revocations.revoke_token(claims):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # Re-read the user so role or name changes are reflected in the new token
+    user = await db.users.find_one({"id": claims["sub"]})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    tokens = issue_tokens(user["id"], user["email"], user["name"], user["role"])
+    return {**tokens, "user": {"id": user["id"], "email": user["email"], "name": user["name"], "role": user["role"]}}
+
+@api_router.post("/auth/logout")
+async def logout(logout_data: Optional[TokenLogout] = None, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if credentials.credentials.count(".") == 2:
+        await token_revocations.revoke_token(decode_token(credentials.credentials, "access"))
+    if logout_data and logout_data.refresh_token:
+        await token_revocations.revoke_token(decode_token(logout_data.refresh_token, "refresh"))
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/me")
 async def get_current_user_profile(current_user: User = Depends(get_current_user)):
-    return current_user
+    user = await db.users.find_one({"id": current_user.id})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return User(**user)
 
 # Essay requests
 @api_router.post("/requests", response_model=EssayRequest)
@@ -291,29 +2405,51 @@ async def create_essay_request(request_data: EssayRequestCreate, current_user: U
     
     request_dict = request_data.dict()
     request_dict["student_id"] = current_user.id
+    request_dict["attachments"] = await resolve_attachments(request_data.attachments, current_user)
     
     essay_request = EssayRequest(**request_dict)
-    await db.essay_requests.insert_one(essay_request.dict())
+    await db.essay_requests.insert_one({**essay_request.dict(), "search_language": request_search_language(request_dict)})
+    await category_cache.adjust(essay_request.field_of_study, 1)
     
     # Create notification for all supervisors
-    supervisors = await db.users.find({"role": "supervisor"}).to_list(None)
-    for supervisor in supervisors:
-        notification = Notification(
-            user_id=supervisor["id"],
-            title="New Essay Request",
-            message=f"New essay request: {essay_request.title}",
-            type="new_request"
-        )
-        await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue_role(
+        "supervisor",
+        title="New Essay Request",
+        message=f"New essay request: {essay_request.title}",
+        type="new_request"
+    )
     
     return essay_request
 
 @api_router.get("/requests", response_model=List[EssayRequest])
 async def get_essay_requests(
+    response: Response,
     search: Optional[str] = None,
     category: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    view: str = "full",
+    fields: Optional[str] = None,
+    search_mode: str = DEFAULT_SEARCH_MODE,
+    embed: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    if search_mode not in ["text", "regex"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="search_mode must be 'text' or 'regex'"
+        )
+    if embed not in [None, "bid_summary"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="embed must be 'bid_summary'"
+        )
+    if embed and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view bid summaries"
+        )
+    projected_fields = essay_request_projection(view, fields)
     query = {}
     
     if current_user.role == "student":
@@ -324,8 +2460,8 @@ async def get_essay_requests(
         query["status"] = "pending"
     # Admins can see all requests (no additional filter)
     
-    # Add search filter
-    if search:
+    # Add search filter (text search is applied below)
+    if search and search_mode == "regex":
         query["$or"] = [
             {"title": {"$regex": search, "$options": "i"}},
             {"field_of_study": {"$regex": search, "$options": "i"}},
@@ -337,33 +2473,47 @@ async def get_essay_requests(
         query["field_of_study"] = category
     
     # Get requests and sort by latest first
-    requests = await db.essay_requests.find(query).sort("created_at", -1).to_list(None)
+    projection = {"_id": 0, **{field: 1 for field in projected_fields}} if projected_fields else None
+    if search and search_mode == "text":
+        # Ranked by relevance, then latest first
+        requests = await text_search(db.essay_requests, query, search, response, limit=limit, cursor=cursor, projection=projection)
+    else:
+        requests = await paginate(db.essay_requests, query, response, limit=limit, cursor=cursor, projection=projection)
     
-    return [EssayRequest(**request) for request in requests]
+    bid_summaries = await get_bid_summaries([request["id"] for request in requests]) if embed else None
+    return projected_essay_requests(requests, view, projected_fields, response, bid_summaries)
 
 @api_router.get("/requests/assigned", response_model=List[EssayRequest])
-async def get_assigned_requests(current_user: User = Depends(get_current_user)):
+async def get_assigned_requests(
+    view: str = "full",
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    projected_fields = essay_request_projection(view, fields)
+    projection = {"_id": 0, **{field: 1 for field in projected_fields}} if projected_fields else None
+    
     if current_user.role == "student":
         # Students can see their assigned requests
-        requests = await db.essay_requests.find({
+        query = {
             "student_id": current_user.id,
             "status": "accepted",
             "assigned_supervisor": {"$ne": None}
-        }).to_list(None)
+        }
     elif current_user.role == "supervisor":
         # Supervisors can see requests assigned to them
-        requests = await db.essay_requests.find({
+        query = {
             "assigned_supervisor": current_user.id,
             "status": "accepted"
-        }).to_list(None)
+        }
     else:  # admin
         # Admins can see all assigned requests
-        requests = await db.essay_requests.find({
+        query = {
             "status": "accepted",
             "assigned_supervisor": {"$ne": None}
-        }).to_list(None)
+        }
+    requests = await db.essay_requests.find(query, projection).to_list(None)
     
-    return [EssayRequest(**request) for request in requests]
+    return projected_essay_requests(requests, view, projected_fields)
 
 @api_router.get("/requests/{request_id}", response_model=EssayRequest)
 async def get_essay_request(request_id: str, current_user: User = Depends(get_current_user)):
@@ -374,17 +2524,7 @@ async def get_essay_request(request_id: str, current_user: User = Depends(get_cu
             detail="Request not found"
         )
     
-    # Check permissions
-    if current_user.role == "student" and request["student_id"] != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    elif current_user.role == "supervisor" and request["status"] != "pending" and request.get("assigned_supervisor") != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    check_request_access(request, current_user)
     
     return EssayRequest(**request)
 
@@ -412,17 +2552,26 @@ async def update_essay_request(request_id: str, request_data: EssayRequestCreate
     # Update request
     update_data = request_data.dict()
     update_data["due_date"] = update_data["due_date"].isoformat() if isinstance(update_data["due_date"], datetime) else update_data["due_date"]
+    existing_ids = {attachment["id"] for attachment in request.get("attachments", []) if isinstance(attachment, dict)}
+    update_data["attachments"] = await resolve_attachments(request_data.attachments, current_user, existing_ids)
+    update_data["search_language"] = request_search_language(update_data)
     
     await db.essay_requests.update_one(
         {"id": request_id},
         {"$set": update_data}
     )
     
+    if request.get("field_of_study") != update_data["field_of_study"]:
+        await category_cache.adjust(request.get("field_of_study"), -1)
+        await category_cache.adjust(update_data["field_of_study"], 1)
+    
     return {"message": "Request updated successfully"}
 
 @api_router.delete("/requests/{request_id}")
 async def delete_essay_request(request_id: str, current_user: User = Depends(admin_only)):
-    await db.essay_requests.delete_one({"id": request_id})
+    deleted = await db.essay_requests.find_one_and_delete({"id": request_id}, {"_id": 0, "field_of_study": 1})
+    if deleted:
+        await category_cache.adjust(deleted.get("field_of_study"), -1)
     return {"message": "Request deleted successfully"}
 
 @api_router.put("/requests/{request_id}/assign")
@@ -448,7 +2597,7 @@ async def assign_request_to_supervisor(request_id: str, supervisor_id: str, curr
         message=f"You have been assigned a new essay request",
         type="assignment"
     )
-    await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue(notification)
     
     return {"message": "Request assigned successfully"}
 
@@ -473,29 +2622,45 @@ async def create_bid(bid_data: BidCreate, current_user: User = Depends(get_curre
     bid_dict["supervisor_id"] = current_user.id
     
     bid = Bid(**bid_dict)
-    await db.bids.insert_one(bid.dict())
+    previous = await upsert_bid(bid)
+    if previous:
+        # A replaced price can't be removed from the running min/max, so
+        # recompute this request's summary from its bids
+        await rebuild_bid_summaries(bid.request_id)
+    else:
+        await record_bid_summary(bid.dict())
     
     # Notify admins about new bid (students don't get notified)
-    admins = await db.users.find({"role": "admin"}).to_list(None)
-    for admin in admins:
-        notification = Notification(
-            user_id=admin["id"],
+    if previous:
+        await notification_dispatcher.enqueue_role(
+            "admin",
+            title="Bid Updated",
+            message=f"{current_user.name} updated their bid for '{request['title']}'",
+            type="bid_submitted"
+        )
+    else:
+        await notification_dispatcher.enqueue_role(
+            "admin",
             title="New Bid Submitted",
             message=f"New bid submitted by {current_user.name} for '{request['title']}'",
             type="bid_submitted"
         )
-        await db.notifications.insert_one(notification.dict())
     
     return bid
 
 @api_router.get("/bids", response_model=List[Bid])
-async def get_bids(current_user: User = Depends(get_current_user)):
+async def get_bids(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role == "supervisor":
         # Supervisors can only see their own bids
-        bids = await db.bids.find({"supervisor_id": current_user.id}).to_list(None)
+        bids = await paginate(db.bids, {"supervisor_id": current_user.id}, response, direction=ASCENDING, limit=limit, cursor=cursor)
     elif current_user.role == "admin":
         # Only admins can see all bids
-        bids = await db.bids.find().to_list(None)
+        bids = await paginate(db.bids, {}, response, direction=ASCENDING, limit=limit, cursor=cursor)
     else:
         # Students cannot see bids at all
         raise HTTPException(
@@ -516,6 +2681,11 @@ async def get_bids_for_request(request_id: str, current_user: User = Depends(get
     bids = await db.bids.find({"request_id": request_id}).to_list(None)
     return [Bid(**bid) for bid in bids]
 
+@api_router.get("/bids/request/{request_id}/summary", response_model=BidSummary)
+async def get_bid_summary(request_id: str, current_user: User = Depends(admin_only)):
+    summaries = await get_bid_summaries([request_id])
+    return summaries[request_id]
+
 @api_router.put("/bids/{bid_id}/status")
 async def update_bid_status(bid_id: str, status_value: str, current_user: User = Depends(admin_only)):
     if status_value not in ["pending", "accepted", "rejected"]:
@@ -524,28 +2694,21 @@ async def update_bid_status(bid_id: str, status_value: str, current_user: User =
             detail="Invalid status"
         )
     
-    bid = await db.bids.find_one({"id": bid_id})
+    if status_value == "accepted":
+        await accept_bid(bid_id)
+        return {"message": "Bid status updated successfully"}
+    
+    bid = await db.bids.find_one_and_update(
+        {"id": bid_id},
+        {"$set": {"status": status_value}},
+        projection={"_id": 0},
+    )
     if not bid:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Bid not found"
         )
-    
-    # Update bid status
-    await db.bids.update_one({"id": bid_id}, {"$set": {"status": status_value}})
-    
-    # Update essay request if bid is accepted
-    if status_value == "accepted":
-        await db.essay_requests.update_one(
-            {"id": bid["request_id"]}, 
-            {"$set": {"status": "accepted", "assigned_supervisor": bid["supervisor_id"]}}
-        )
-        
-        # Reject other bids for this request
-        await db.bids.update_many(
-            {"request_id": bid["request_id"], "id": {"$ne": bid_id}},
-            {"$set": {"status": "rejected"}}
-        )
+    await record_bid_status_change(bid["request_id"], bid["status"], status_value)
     
     # Notify supervisor
     notification = Notification(
@@ -554,7 +2717,7 @@ async def update_bid_status(bid_id: str, status_value: str, current_user: User =
         message=f"Your bid has been {status_value}",
         type="bid_status_update"
     )
-    await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue(notification)
     
     return {"message": "Bid status updated successfully"}
 
@@ -593,53 +2756,158 @@ async def send_message(message_data: ChatMessageCreate, current_user: User = Dep
     message_dict["approved"] = False  # Messages need admin approval
     
     message = ChatMessage(**message_dict)
+    message.visible_at = message.timestamp
     await db.chat_messages.insert_one(message.dict())
+    chat_hub.publish(message.request_id, message)
     
     # Notify admin about new message that needs approval
-    admins = await db.users.find({"role": "admin"}).to_list(None)
-    for admin in admins:
-        notification = Notification(
-            user_id=admin["id"],
-            title="Message Needs Approval",
-            message=f"New message from {current_user.name} needs approval for request: {request['title']}",
-            type="message_approval"
-        )
-        await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue_role(
+        "admin",
+        title="Message Needs Approval",
+        message=f"New message from {current_user.name} needs approval for request: {request['title']}",
+        type="message_approval"
+    )
     
     return message
 
 @api_router.get("/chat/{request_id}", response_model=List[ChatMessage])
-async def get_chat_messages(request_id: str, current_user: User = Depends(get_current_user)):
+async def get_chat_messages(
+    request_id: str,
+    response: Response,
+    since: Optional[datetime] = None,
+    since_id: Optional[str] = None,
+    before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user)
+):
     # Check permissions
-    request = await db.essay_requests.find_one({"id": request_id})
+    request = await db.essay_requests.find_one({"id": request_id}, {"_id": 0, "student_id": 1, "assigned_supervisor": 1})
     if not request:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Request not found"
         )
     
-    if current_user.role == "student" and request["student_id"] != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
-    elif current_user.role == "supervisor" and request.get("assigned_supervisor") != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    check_chat_access(request, current_user)
+    is_admin = current_user.role == "admin"
     
     # Students and supervisors only see approved messages
-    if current_user.role in ["student", "supervisor"]:
-        messages = await db.chat_messages.find({"request_id": request_id, "approved": True}).sort("timestamp", 1).to_list(None)
-    else:  # Admin sees all messages
-        messages = await db.chat_messages.find({"request_id": request_id}).sort("timestamp", 1).to_list(None)
+    query = chat_messages_query(request_id, is_admin, since, since_id)
+    if before is not None:
+        query["timestamp"] = {**query.get("timestamp", {}), "$lt": before}
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE)
+    
+    mark = None
+    if since is None:
+        # History (before a point, or the latest messages), returned oldest first
+        cursor = db.chat_messages.find(query).sort([("timestamp", DESCENDING), ("id", DESCENDING)])
+        if limit is not None:
+            cursor = cursor.limit(limit + 1)
+        messages = await cursor.to_list(None)
+        has_more = limit is not None and len(messages) > limit
+        messages = list(reversed(messages[:limit] if limit is not None else messages))
+        if before is None:
+            # Deltas start after the most recently visible message, which may
+            # be an old one approved late and so not on this page
+            latest = await db.chat_messages.find(
+                chat_messages_query(request_id, is_admin), {"_id": 0, "visible_at": 1, "id": 1}
+            ).sort([("visible_at", DESCENDING), ("id", DESCENDING)]).limit(1).to_list(None)
+            if latest and latest[0].get("visible_at"):
+                mark = (latest[0]["visible_at"], latest[0]["id"])
+    else:
+        # Delta in visibility order; resume after the last message returned
+        cursor = db.chat_messages.find(query).sort([("visible_at", ASCENDING), ("id", ASCENDING)])
+        if limit is not None:
+            cursor = cursor.limit(limit + 1)
+        messages = await cursor.to_list(None)
+        has_more = limit is not None and len(messages) > limit
+        messages = messages[:limit] if limit is not None else messages
+        if messages:
+            mark = (messages[-1]["visible_at"], messages[-1]["id"])
+        else:
+            mark = (since.astimezone(timezone.utc).replace(tzinfo=None) if since.tzinfo else since, since_id)
+    
+    # High-water mark for the next ?since=&since_id= call
+    if mark is not None:
+        response.headers["X-High-Water-Mark"] = mark[0].isoformat()
+        if mark[1]:
+            response.headers["X-High-Water-Id"] = mark[1]
+    response.headers["X-Has-More"] = "true" if has_more else "false"
     
     return [ChatMessage(**message) for message in messages]
 
+@api_router.websocket("/chat/{request_id}/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    request_id: str,
+    token: str,
+    since: Optional[datetime] = None,
+    since_id: Optional[str] = None,
+):
+    # Browsers can't set headers on WebSocket handshakes, so the access token
+    # comes in the query string. Same access rules as get_chat_messages.
+    try:
+        current_user = await authenticate_token(token)
+        request = await db.essay_requests.find_one({"id": request_id}, {"_id": 0, "student_id": 1, "assigned_supervisor": 1})
+        if not request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Request not found"
+            )
+        check_chat_access(request, current_user)
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=e.detail)
+        return
+    
+    is_admin = current_user.role == "admin"
+    await websocket.accept()
+    
+    # Subscribe before reading the backlog so nothing approved in between is missed
+    queue = chat_hub.subscribe(request_id)
+    sent_ids = set()
+    
+    async def send(message: ChatMessage):
+        if message.id in sent_ids or (not is_admin and not message.approved):
+            return
+        sent_ids.add(message.id)
+        await websocket.send_json({"type": "message", "message": jsonable_encoder(message)})
+    
+    async def push():
+        if since is not None:
+            query = chat_messages_query(request_id, is_admin, since, since_id)
+            async for message in db.chat_messages.find(query, {"_id": 0}).sort([("visible_at", ASCENDING), ("id", ASCENDING)]):
+                await send(ChatMessage(**message))
+        while True:
+            await send(await queue.get())
+    
+    async def receive():
+        # Only used to notice the client going away
+        while True:
+            await websocket.receive_text()
+    
+    tasks = [asyncio.create_task(push()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        chat_hub.unsubscribe(request_id, queue)
+    for task in tasks:
+        if not task.cancelled() and task.done() and task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+            logger.error(f"Chat WebSocket for {request_id} failed: {task.exception()}")
+
 @api_router.get("/admin/messages/pending", response_model=List[ChatMessage])
-async def get_pending_messages(current_user: User = Depends(admin_only)):
-    messages = await db.chat_messages.find({"approved": False}).sort("timestamp", 1).to_list(None)
+async def get_pending_messages(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(admin_only)
+):
+    messages = await paginate(
+        db.chat_messages, {"approved": False}, response,
+        sort_field="timestamp", direction=ASCENDING, limit=limit, cursor=cursor
+    )
     return [ChatMessage(**message) for message in messages]
 
 @api_router.put("/admin/messages/{message_id}/approve")
@@ -652,10 +2920,13 @@ async def approve_message(message_id: str, current_user: User = Depends(admin_on
         )
     
     # Approve message
+    approved_at = datetime.utcnow()
+    approval = {"approved": True, "approved_by": current_user.id, "approved_at": approved_at, "visible_at": approved_at}
     await db.chat_messages.update_one(
         {"id": message_id},
-        {"$set": {"approved": True, "approved_by": current_user.id, "approved_at": datetime.utcnow()}}
+        {"$set": approval}
     )
+    chat_hub.publish(message["request_id"], ChatMessage(**{**message, **approval}))
     
     # Notify receiver about approved message
     notification = Notification(
@@ -664,7 +2935,7 @@ async def approve_message(message_id: str, current_user: User = Depends(admin_on
         message=f"You have a new message in your chat",
         type="message_approved"
     )
-    await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue(notification)
     
     return {"message": "Message approved successfully"}
 
@@ -675,48 +2946,145 @@ async def delete_message(message_id: str, current_user: User = Depends(admin_onl
 
 # Notifications
 @api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications(current_user: User = Depends(get_current_user)):
-    notifications = await db.notifications.find({"user_id": current_user.id}).sort("created_at", -1).to_list(None)
+async def get_notifications(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    notifications = await paginate(db.notifications, {"user_id": current_user.id}, response, limit=limit, cursor=cursor)
     return [Notification(**notification) for notification in notifications]
 
+def notification_event(notification: Notification) -> str:
+    # The event id doubles as the resume point (Last-Event-ID) on reconnect
+    data = json.dumps(jsonable_encoder(notification))
+    return f"id: {notification.created_at.isoformat()}\nevent: notification\ndata: {data}\n\n"
+
+@api_router.get("/notifications/stream")
+async def stream_notifications(request: Request, token: Optional[str] = None, since: Optional[datetime] = None):
+    # EventSource can't send an Authorization header, so the token may also come in the query string
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[len("bearer "):]
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_user = await authenticate_token(token)
+    
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            since = datetime.fromisoformat(last_event_id)
+        except ValueError:
+            pass
+    
+    # Subscribe before reading the backlog so nothing inserted in between is missed
+    queue = notification_hub.subscribe(current_user.id)
+    
+    async def events():
+        sent_ids = set()
+        try:
+            # Initial burst: unread notifications since the given point, oldest first
+            query = {"user_id": current_user.id, "read": False}
+            if since is not None:
+                query["created_at"] = {"$gt": since}
+            backlog = await db.notifications.find(query, {"_id": 0}).sort(
+                [("created_at", DESCENDING), ("id", DESCENDING)]
+            ).limit(MAX_PAGE_SIZE).to_list(None)
+            for notification in reversed(backlog):
+                sent_ids.add(notification["id"])
+                yield notification_event(Notification(**notification))
+            
+            while not await request.is_disconnected():
+                try:
+                    notification = await asyncio.wait_for(queue.get(), NOTIFICATION_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if notification.id not in sent_ids:
+                    yield notification_event(notification)
+        finally:
+            notification_hub.unsubscribe(current_user.id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.put("/notifications/read-all")
+async def mark_all_notifications_read(before: Optional[datetime] = None, current_user: User = Depends(get_current_user)):
+    # Everything unread, or only what was created before the given time
+    query = {"user_id": current_user.id, "read": False}
+    if before is not None:
+        query["created_at"] = {"$lt": before}
+    result = await db.notifications.update_many(query, {"$set": {"read": True}})
+    await decrement_unread_counter(current_user.id, result.modified_count)
+    return {"message": "Notifications marked as read", "updated": result.modified_count}
+
+@api_router.put("/notifications/read")
+async def mark_notifications_read(notification_ids: NotificationIds, current_user: User = Depends(get_current_user)):
+    result = await db.notifications.update_many(
+        {"id": {"$in": notification_ids.ids}, "user_id": current_user.id, "read": False},
+        {"$set": {"read": True}}
+    )
+    await decrement_unread_counter(current_user.id, result.modified_count)
+    return {"message": "Notifications marked as read", "updated": result.modified_count}
+
+@api_router.delete("/notifications/read")
+async def purge_read_notifications(before: datetime, current_user: User = Depends(get_current_user)):
+    # Only read notifications are removed, so unread counters are unaffected
+    result = await db.notifications.delete_many({"user_id": current_user.id, "read": True, "created_at": {"$lt": before}})
+    return {"message": "Read notifications deleted", "deleted": result.deleted_count}
+
+@api_router.delete("/admin/notifications/read")
+async def purge_all_read_notifications(before: datetime, current_user: User = Depends(admin_only)):
+    result = await db.notifications.delete_many({"read": True, "created_at": {"$lt": before}})
+    return {"message": "Read notifications deleted", "deleted": result.deleted_count}
+
+@api_router.get("/notifications/unread-count")
+async def get_unread_notification_count(current_user: User = Depends(get_current_user)):
+    counter = await db.notification_counters.find_one({"user_id": current_user.id}, {"_id": 0, "unread": 1})
+    return {"unread": max(counter["unread"], 0) if counter else 0}
+
+@api_router.post("/admin/notifications/reconcile-counters")
+async def run_unread_reconciliation(current_user: User = Depends(admin_only)):
+    corrected = await reconcile_unread_counters()
+    return {"corrected": corrected}
+
+@api_router.post("/admin/notifications/archive")
+async def run_notification_archival(current_user: User = Depends(admin_only)):
+    archived = await archive_notifications()
+    return {"archived": archived}
+
+@api_router.get("/admin/notifications/dispatcher")
+async def get_notification_dispatcher_stats(current_user: User = Depends(admin_only)):
+    return {**notification_dispatcher.stats(), "stream": notification_hub.stats()}
+
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: User = Depends(get_current_user)):
-    await db.notifications.update_one(
-        {"id": notification_id, "user_id": current_user.id},
+    result = await db.notifications.update_one(
+        {"id": notification_id, "user_id": current_user.id, "read": False},
         {"$set": {"read": True}}
     )
+    await decrement_unread_counter(current_user.id, result.modified_count)
     return {"message": "Notification marked as read"}
 
 # Admin settings
 @api_router.get("/admin/settings", response_model=AdminSettings)
 async def get_admin_settings(current_user: User = Depends(admin_only)):
-    settings = await db.admin_settings.find_one()
-    if not settings:
-        # Create default settings
-        default_settings = AdminSettings()
-        await db.admin_settings.insert_one(default_settings.dict())
-        return default_settings
-    
-    return AdminSettings(**settings)
+    return await admin_settings_cache.get()
 
 @api_router.put("/admin/settings")
 async def update_admin_settings(settings_data: AdminSettingsUpdate, current_user: User = Depends(admin_only)):
-    current_settings = await db.admin_settings.find_one()
-    
-    if not current_settings:
-        # Create default settings first
-        default_settings = AdminSettings()
-        await db.admin_settings.insert_one(default_settings.dict())
-        current_settings = default_settings.dict()
-    
     # Update only provided fields
     update_data = {k: v for k, v in settings_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.admin_settings.update_one(
-        {"id": current_settings["id"]},
-        {"$set": update_data}
-    )
+    await admin_settings_cache.update(update_data)
     
     return {"message": "Settings updated successfully"}
 
@@ -744,13 +3112,18 @@ async def set_admin_price(price_data: AdminPriceCreate, current_user: User = Dep
         message=f"Admin set price ${admin_price.price} for your request: {request['title']}",
         type="admin_price"
     )
-    await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue(notification)
     
     return admin_price
 
 @api_router.get("/admin/prices", response_model=List[AdminPrice])
-async def get_admin_prices(current_user: User = Depends(admin_only)):
-    prices = await db.admin_prices.find().to_list(None)
+async def get_admin_prices(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(admin_only)
+):
+    prices = await paginate(db.admin_prices, {}, response, direction=ASCENDING, limit=limit, cursor=cursor)
     return [AdminPrice(**price) for price in prices]
 
 @api_router.get("/prices/request/{request_id}", response_model=List[AdminPrice])
@@ -780,36 +3153,42 @@ async def delete_admin_price(price_id: str, current_user: User = Depends(admin_o
 # System settings management
 @api_router.get("/admin/system-settings", response_model=SystemSettings)
 async def get_system_settings(current_user: User = Depends(admin_only)):
-    settings = await db.system_settings.find_one()
-    if not settings:
-        # Create default settings
-        default_settings = SystemSettings()
-        await db.system_settings.insert_one(default_settings.dict())
-        return default_settings
-    
-    return SystemSettings(**settings)
+    return await system_settings_cache.get()
 
 @api_router.put("/admin/system-settings")
 async def update_system_settings(settings_data: SystemSettingsUpdate, current_user: User = Depends(admin_only)):
-    current_settings = await db.system_settings.find_one()
-    
-    if not current_settings:
-        # Create default settings first
-        default_settings = SystemSettings()
-        await db.system_settings.insert_one(default_settings.dict())
-        current_settings = default_settings.dict()
-    
     # Update only provided fields
     update_data = {k: v for k, v in settings_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.system_settings.update_one(
-        {"id": current_settings["id"]},
-        {"$set": update_data}
-    )
+    await system_settings_cache.update(update_data)
     
     return {"message": "System settings updated successfully"}
 
+# Attachment migration
+@api_router.post("/admin/attachments/migrate")
+async def run_attachment_migration(current_user: User = Depends(admin_only)):
+    migrated = await migrate_embedded_attachments()
+    return {"migrated_requests": migrated}
+
+# Index report
+@api_router.get("/admin/indexes")
+async def get_index_report(refresh: bool = False, current_user: User = Depends(admin_only)):
+    if refresh:
+        await ensure_indexes()
+    return {"indexes": index_report}
+
+# Public branding
+@api_router.get("/branding")
+async def get_branding(request: Request):
+    if not branding_snapshot.body:
+        await system_settings_cache.get()
+    headers = {"ETag": branding_snapshot.etag, "Cache-Control": BRANDING_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and branding_snapshot.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=branding_snapshot.body, media_type="application/json", headers=headers)
+
 # Q&A System
 @api_router.post("/questions", response_model=Question)
 async def create_question(question_data: QuestionCreate, current_user: User = Depends(get_current_user)):
@@ -826,26 +3205,28 @@ async def create_question(question_data: QuestionCreate, current_user: User = De
     await db.questions.insert_one(question.dict())
     
     # Notify admins
-    admins = await db.users.find({"role": "admin"}).to_list(None)
-    for admin in admins:
-        notification = Notification(
-            user_id=admin["id"],
-            title="New Question",
-            message=f"New question from {current_user.name}: {question.title}",
-            type="new_question"
-        )
-        await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue_role(
+        "admin",
+        title="New Question",
+        message=f"New question from {current_user.name}: {question.title}",
+        type="new_question"
+    )
     
     return question
 
 @api_router.get("/questions", response_model=List[Question])
-async def get_questions(current_user: User = Depends(get_current_user)):
+async def get_questions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role == "admin":
         # Admins can see all questions, sorted by latest
-        questions = await db.questions.find().sort("created_at", -1).to_list(None)
+        questions = await paginate(db.questions, {}, response, limit=limit, cursor=cursor)
     else:
         # Students and supervisors can only see their own questions
-        questions = await db.questions.find({"user_id": current_user.id}).sort("created_at", -1).to_list(None)
+        questions = await paginate(db.questions, {"user_id": current_user.id}, response, limit=limit, cursor=cursor)
     
     return [Question(**question) for question in questions]
 
@@ -876,7 +3257,7 @@ async def answer_question(question_id: str, answer_data: QuestionAnswer, current
         message=f"Your question '{question['title']}' has been answered",
         type="question_answered"
     )
-    await db.notifications.insert_one(notification.dict())
+    await notification_dispatcher.enqueue(notification)
     
     return {"message": "Question answered successfully"}
 
@@ -887,7 +3268,9 @@ async def delete_question(question_id: str, current_user: User = Depends(admin_o
 
 # Forgot password (basic implementation)
 @api_router.post("/auth/forgot-password")
-async def forgot_password(email: str):
+async def forgot_password(email: str, request: Request):
+    await check_auth_rate_limit(request, "forgot-password", email)
+    
     user = await db.users.find_one({"email": email})
     if not user:
         # Don't reveal if email exists or not for security
@@ -903,15 +3286,40 @@ async def forgot_password(email: str):
 
 # Get categories for filtering
 @api_router.get("/categories")
-async def get_categories(current_user: User = Depends(get_current_user)):
-    # Get unique field_of_study values from requests
-    categories = await db.essay_requests.distinct("field_of_study")
-    return {"categories": categories}
+async def get_categories(request: Request, current_user: User = Depends(get_current_user)):
+    # Served from the materialized categories collection
+    counts = await category_cache.get()
+    headers = {"ETag": category_cache.etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == category_cache.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse({"categories": list(counts), "counts": counts}, headers=headers)
+
+@api_router.post("/admin/bids/collapse-duplicates")
+async def collapse_duplicate_bids_endpoint(current_user: User = Depends(admin_only)):
+    result = await collapse_duplicate_bids()
+    # Build the unique index if duplicates had blocked it
+    await ensure_indexes()
+    return result
+
+@api_router.post("/admin/bids/summaries/rebuild")
+async def rebuild_bid_summaries_endpoint(current_user: User = Depends(admin_only)):
+    rebuilt = await rebuild_bid_summaries()
+    return {"rebuilt": rebuilt}
+
+@api_router.post("/admin/categories/rebuild")
+async def rebuild_categories(current_user: User = Depends(admin_only)):
+    counts = await category_cache.rebuild()
+    return {"categories": list(counts), "counts": counts}
 
 # User management (admin only)
 @api_router.get("/admin/users", response_model=List[User])
-async def get_all_users(current_user: User = Depends(admin_only)):
-    users = await db.users.find().to_list(None)
+async def get_all_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(admin_only)
+):
+    users = await paginate(db.users, {}, response, direction=ASCENDING, limit=limit, cursor=cursor)
     return [User(**user) for user in users]
 
 @api_router.post("/admin/users", response_model=User)
@@ -926,7 +3334,7 @@ async def create_user(user_data: UserCreate, current_user: User = Depends(admin_
     
     # Create new user
     user_dict = user_data.dict()
-    user_dict["password_hash"] = hash_password(user_data.password)
+    user_dict["password_hash"] = await hash_password(user_data.password)
     del user_dict["password"]
     
     user = User(**user_dict)
@@ -946,21 +3354,37 @@ async def update_user(user_id: str, user_data: UserCreate, current_user: User =
     # Update user data
     update_data = user_data.dict()
     if update_data.get("password"):
-        update_data["password_hash"] = hash_password(update_data["password"])
+        update_data["password_hash"] = await hash_password(update_data["password"])
         del update_data["password"]
     
     await db.users.update_one(
         {"id": user_id},
         {"$set": update_data}
     )
+    user_cache.invalidate_user(user_id)
+    await token_revocations.revoke_user(user_id)
     
     return {"message": "User updated successfully"}
 
 @api_router.delete("/admin/users/{user_id}")
 async def delete_user(user_id: str, current_user: User = Depends(admin_only)):
     await db.users.delete_one({"id": user_id})
+    user_cache.invalidate_user(user_id)
+    await token_revocations.revoke_user(user_id)
     return {"message": "User deleted successfully"}
 
+@api_router.get("/admin/auth-cache")
+async def get_auth_cache_stats(current_user: User = Depends(admin_only)):
+    return user_cache.stats()
+
+@api_router.get("/admin/bids/acceptance-stats")
+async def get_bid_acceptance_stats(current_user: User = Depends(admin_only)):
+    return bid_acceptance_metrics.stats()
+
+@api_router.get("/admin/auth-rate-limits")
+async def get_auth_rate_limit_stats(current_user: User = Depends(admin_only)):
+    return auth_rate_limiter.stats()
+
 @api_router.get("/admin/supervisors", response_model=List[User])
 async def get_all_supervisors(current_user: User = Depends(admin_only)):
     supervisors = await db.users.find({"role": "supervisor"}).to_list(None)
@@ -994,8 +3418,13 @@ async def create_payment_info(payment_data: PaymentInfoCreate, current_user: Use
     return payment_info
 
 @api_router.get("/admin/payments", response_model=List[PaymentInfo])
-async def get_all_payment_info(current_user: User = Depends(admin_only)):
-    payments = await db.payment_info.find().to_list(None)
+async def get_all_payment_info(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(admin_only)
+):
+    payments = await paginate(db.payment_info, {}, response, direction=ASCENDING, limit=limit, cursor=cursor)
     return [PaymentInfo(**payment) for payment in payments]
 
 @api_router.get("/payments/student/{student_id}", response_model=List[PaymentInfo])
@@ -1088,7 +3517,7 @@ async def approve_payment(payment_id: str, current_user: User = Depends(admin_on
             message=f"Your payment has been approved and essay '{request['title']}' has been assigned",
             type="payment_approved"
         )
-        await db.notifications.insert_one(notification.dict())
+        await notification_dispatcher.enqueue(notification)
     
     return {"message": "Payment approved and essay assigned successfully"}
 
@@ -1115,17 +3544,141 @@ async def delete_payment_info(payment_id: str, current_user: User = Depends(admi
     return {"message": "Payment information deleted successfully"}
 
 # File upload
-@api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    # Read file content and convert to base64
-    content = await file.read()
-    base64_content = base64.b64encode(content).decode('utf-8')
+@api_router.post("/upload", response_model=AttachmentRef)
+async def upload_file(request: Request, file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+    check_content_length(request)
+    
+    # Copy the spooled multipart file into the store chunk by chunk
+    async def chunks():
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    attachment = await store_attachment(
+        limit_upload_size(chunks(), MAX_UPLOAD_BYTES),
+        file.filename or "upload",
+        file.content_type,
+        current_user.id
+    )
+    return AttachmentRef(**attachment.dict())
+
+@api_router.post("/attachments", response_model=AttachmentRef)
+async def upload_attachment_stream(request: Request, filename: str, current_user: User = Depends(get_current_user)):
+    # Raw request body upload: bytes are written to storage as they arrive
+    check_content_length(request)
+    
+    attachment = await store_attachment(
+        limit_upload_size(request.stream(), MAX_UPLOAD_BYTES),
+        filename,
+        request.headers.get("content-type"),
+        current_user.id
+    )
+    return AttachmentRef(**attachment.dict())
+
+# Attachment download
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(range_header: str, size: int) -> Optional[tuple]:
+    # Single byte range only; multi-range requests get the whole file. A
+    # syntactically invalid range is ignored (200 with the full body); a valid
+    # one that selects no bytes of this file is a 416.
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise range_not_satisfiable(size)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise range_not_satisfiable(size)
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+def range_not_satisfiable(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        detail="Range not satisfiable",
+        headers={"Content-Range": f"bytes */{size}"}
+    )
+
+@api_router.get("/attachments/{attachment_id}")
+async def download_attachment(attachment_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    attachment = await db.attachments.find_one({"id": attachment_id}, {"_id": 0})
+    if not attachment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment not found"
+        )
     
-    return {
-        "filename": file.filename,
-        "content_type": file.content_type,
-        "data": base64_content
+    # Same rules as the request it belongs to; unattached uploads are private to the uploader
+    essay_request = await db.essay_requests.find_one(
+        {"attachments.id": attachment_id},
+        {"_id": 0, "student_id": 1, "status": 1, "assigned_supervisor": 1}
+    )
+    if essay_request:
+        check_request_access(essay_request, current_user)
+    elif attachment["uploaded_by"] != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    size = attachment["size"]
+    etag = f'"{attachment["sha256"]}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(attachment['filename'])}",
     }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = parse_range(range_header, size)
+    
+    start, end = byte_range if byte_range else (0, size - 1)
+    length = end - start + 1 if size else 0
+    headers["Content-Length"] = str(length)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    
+    reader = await blob_store.open(attachment["storage_key"])
+    reader.seek(start)
+    
+    async def body():
+        remaining = length
+        try:
+            while remaining > 0:
+                chunk = await reader.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            reader.close()
+    
+    return StreamingResponse(
+        body(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=attachment["content_type"],
+        headers=headers
+    )
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -1136,6 +3689,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-High-Water-Mark", "X-High-Water-Id", "X-Has-More", "ETag", "Content-Range", "Content-Disposition"],
 )
 
 # Configure logging
@@ -1145,6 +3699,88 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_jwt_secret_key():
+    global JWT_SECRET_KEY
+    if not JWT_SECRET_KEY:
+        JWT_SECRET_KEY = await load_jwt_secret_key()
+        logger.info("JWT_SECRET_KEY is not set; using the shared key stored in app_secrets")
+
+@app.on_event("startup")
+async def startup_collapse_duplicate_bids():
+    # Runs before the indexes so the unique bid index can be built; once it
+    # exists there can be no duplicates left to collapse
+    if COLLAPSE_DUPLICATE_BIDS_ON_STARTUP and "request_id_supervisor_id_unique" not in await db.bids.index_information():
+        await collapse_duplicate_bids()
+
+@app.on_event("startup")
+async def startup_backfill_chat_visible_at():
+    # Runs before the indexes, whose presence marks the backfill as done
+    await backfill_chat_visible_at()
+
+@app.on_event("startup")
+async def startup_dedupe_revoked_tokens():
+    await dedupe_revoked_tokens()
+
+@app.on_event("startup")
+async def startup_ensure_indexes():
+    drop_unexpected = os.environ.get("DROP_UNEXPECTED_INDEXES", "false").lower() == "true"
+    await ensure_indexes(drop_unexpected=drop_unexpected)
+
+@app.on_event("startup")
+async def startup_migrate_attachments():
+    if MIGRATE_ATTACHMENTS_ON_STARTUP:
+        await migrate_embedded_attachments()
+
+@app.on_event("startup")
+async def startup_categories():
+    # Build the collection the first time, or on demand via the env flag
+    if REBUILD_CATEGORIES_ON_STARTUP or await db.categories.estimated_document_count() == 0:
+        await category_cache.rebuild()
+
+@app.on_event("startup")
+async def startup_bid_summaries():
+    if REBUILD_BID_SUMMARIES_ON_STARTUP or (
+        await db.bid_summaries.estimated_document_count() == 0
+        and await db.bids.estimated_document_count() > 0
+    ):
+        await rebuild_bid_summaries()
+
+@app.on_event("startup")
+async def startup_settings():
+    await admin_settings_cache.load()
+    await system_settings_cache.load()
+    app.state.settings_sync_task = asyncio.create_task(sync_settings())
+
+@app.on_event("shutdown")
+async def shutdown_settings():
+    app.state.settings_sync_task.cancel()
+
+@app.on_event("startup")
+async def startup_token_revocations():
+    await token_revocations.sync()
+    app.state.revocation_sync_task = asyncio.create_task(sync_token_revocations())
+
+@app.on_event("shutdown")
+async def shutdown_token_revocations():
+    app.state.revocation_sync_task.cancel()
+
+@app.on_event("startup")
+async def startup_notification_dispatcher():
+    notification_dispatcher.start()
+    app.state.unread_reconcile_task = asyncio.create_task(reconcile_unread_counters_periodically())
+    app.state.notification_archive_task = asyncio.create_task(archive_notifications_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_notification_dispatcher():
+    app.state.unread_reconcile_task.cancel()
+    app.state.notification_archive_task.cancel()
+    await notification_dispatcher.stop()
+
+@app.on_event("shutdown")
+async def shutdown_password_executor():
+    password_executor.shutdown(wait=False)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
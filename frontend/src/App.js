@@ -5,6 +5,31 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Refresh tokens are single use, so concurrent callers share one refresh request
+let refreshInFlight = null;
+const refreshAccessToken = () => {
+  if (!refreshInFlight) {
+    refreshInFlight = (async () => {
+      const refreshToken = localStorage.getItem('refresh_token');
+      if (!refreshToken) throw new Error('No refresh token');
+      try {
+        const response = await axios.post(`${API}/auth/refresh`, { refresh_token: refreshToken });
+        const { token: newToken, refresh_token: newRefreshToken } = response.data;
+        localStorage.setItem('token', newToken);
+        localStorage.setItem('refresh_token', newRefreshToken);
+        axios.defaults.headers.common['Authorization'] = `Bearer ${newToken}`;
+        return newToken;
+      } catch (error) {
+        localStorage.removeItem('refresh_token');
+        throw error;
+      }
+    })().finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
+};
+
 // Language context
 const LanguageContext = createContext();
 
@@ -304,9 +329,10 @@ const SystemSettingsProvider = ({ children }) => {
     meta_description: "Professional essay writing and bidding platform connecting students with qualified supervisors"
   });
 
-  const fetchSystemSettings = async () => {
+  const fetchSystemSettings = async (revalidate = false) => {
     try {
-      const response = await axios.get(`${API}/admin/system-settings`);
+      // Public, cacheable endpoint; revalidate after an admin edit to skip the browser cache
+      const response = await axios.get(`${API}/branding`, revalidate ? { headers: { 'Cache-Control': 'no-cache' } } : {});
       setSystemSettings(response.data);
     } catch (error) {
       console.error('Error fetching system settings:', error);
@@ -339,6 +365,34 @@ const AuthProvider = ({ children }) => {
     }
   }, [token]);
 
+  // Access tokens are short-lived: on a 401, exchange the refresh token once and retry
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        const refreshToken = localStorage.getItem('refresh_token');
+        if (
+          error.response?.status === 401 &&
+          refreshToken &&
+          !original._retried &&
+          !original.url.endsWith('/auth/refresh')
+        ) {
+          original._retried = true;
+          try {
+            const newToken = await refreshAccessToken();
+            original.headers['Authorization'] = `Bearer ${newToken}`;
+            return axios(original);
+          } catch (refreshError) {
+            // Refresh token rejected; the original 401 stands
+          }
+        }
+        return Promise.reject(error);
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   const fetchUser = async () => {
     try {
       const response = await axios.get(`${API}/auth/me`);
@@ -354,11 +408,12 @@ const AuthProvider = ({ children }) => {
   const login = async (email, password) => {
     try {
       const response = await axios.post(`${API}/auth/login`, { email, password });
-      const { token: newToken, user: userData } = response.data;
+      const { token: newToken, refresh_token: refreshToken, user: userData } = response.data;
       
       setToken(newToken);
       setUser(userData);
       localStorage.setItem('token', newToken);
+      localStorage.setItem('refresh_token', refreshToken);
       axios.defaults.headers.common['Authorization'] = `Bearer ${newToken}`;
       
       return true;
@@ -371,11 +426,12 @@ const AuthProvider = ({ children }) => {
   const register = async (userData) => {
     try {
       const response = await axios.post(`${API}/auth/register`, userData);
-      const { token: newToken, user: newUser } = response.data;
+      const { token: newToken, refresh_token: refreshToken, user: newUser } = response.data;
       
       setToken(newToken);
       setUser(newUser);
       localStorage.setItem('token', newToken);
+      localStorage.setItem('refresh_token', refreshToken);
       axios.defaults.headers.common['Authorization'] = `Bearer ${newToken}`;
       
       return true;
@@ -389,6 +445,7 @@ const AuthProvider = ({ children }) => {
     setToken(null);
     setUser(null);
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     delete axios.defaults.headers.common['Authorization'];
   };
 
@@ -591,6 +648,49 @@ const Navigation = () => {
 
   useEffect(() => {
     fetchNotifications();
+
+    // New notifications are pushed over SSE instead of refetching the list.
+    // The access token is in the URL and expires, so when the server rejects
+    // a reconnect (EventSource gives up for good) refresh it and reopen.
+    let source;
+    let closed = false;
+    let retryTimer;
+    let retryDelay = 1000;
+    let since = new Date().toISOString();
+
+    const open = (token) => {
+      const params = new URLSearchParams({ token: token || '', since });
+      source = new EventSource(`${API}/notifications/stream?${params}`);
+      source.addEventListener('open', () => {
+        retryDelay = 1000;
+      });
+      source.addEventListener('notification', (event) => {
+        const notification = JSON.parse(event.data);
+        if (notification.created_at > since) since = notification.created_at;
+        setNotifications((current) => (
+          current.some((n) => n.id === notification.id) ? current : [notification, ...current]
+        ));
+      });
+      source.addEventListener('error', () => {
+        if (source.readyState !== EventSource.CLOSED || closed) return;
+        retryTimer = setTimeout(async () => {
+          try {
+            const newToken = await refreshAccessToken();
+            if (!closed) open(newToken);
+          } catch (error) {
+            console.error('Notification stream stopped:', error);
+          }
+        }, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 60000);
+      });
+    };
+
+    open(localStorage.getItem('token'));
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
   }, []);
 
   const fetchNotifications = async () => {
@@ -1252,7 +1352,7 @@ const SystemSettings = () => {
     setLoading(true);
     try {
       await axios.put(`${API}/admin/system-settings`, settings);
-      await fetchSystemSettings();
+      await fetchSystemSettings(true);
       alert('System settings updated successfully');
     } catch (error) {
       console.error('Error updating system settings:', error);
@@ -1984,15 +2084,44 @@ const ChatModal = ({ requestId, requestTitle, onClose }) => {
   const [newMessage, setNewMessage] = useState('');
 
   useEffect(() => {
-    fetchMessages();
+    let socket;
+    let closed = false;
+
+    const connect = async () => {
+      const mark = await fetchMessages();
+      if (closed) return;
+
+      // Approved messages are pushed as they arrive; resume from the server's high-water mark
+      const wsUrl = `${API.replace(/^http/, 'ws')}/chat/${requestId}/ws`;
+      const params = new URLSearchParams({ token: localStorage.getItem('token') || '', since: mark.since || new Date().toISOString() });
+      if (mark.sinceId) params.set('since_id', mark.sinceId);
+      socket = new WebSocket(`${wsUrl}?${params}`);
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type !== 'message') return;
+        setMessages((current) => (
+          current.some((message) => message.id === data.message.id)
+            ? current.map((message) => (message.id === data.message.id ? data.message : message))
+            : [...current, data.message]
+        ));
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      if (socket) socket.close();
+    };
   }, [requestId]);
 
   const fetchMessages = async () => {
     try {
       const response = await axios.get(`${API}/chat/${requestId}`);
       setMessages(response.data);
+      return { since: response.headers['x-high-water-mark'], sinceId: response.headers['x-high-water-id'] };
     } catch (error) {
       console.error('Error fetching messages:', error);
+      return {};
     }
   };
 
@@ -0,0 +1,173 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import CollectionInvalid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+def _matches(document, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document.get(key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            for op, operand in condition.items():
+                if op == "$exists":
+                    if (key in document) != operand:
+                        return False
+                elif op == "$type":
+                    # Arrays match when any element has the type
+                    assert operand == "string"
+                    values = value if isinstance(value, list) else [value]
+                    if not any(isinstance(item, str) for item in values):
+                        return False
+                elif op == "$in":
+                    if value not in operand:
+                        return False
+                elif op in ("$gt", "$lt", "$gte", "$lte", "$ne"):
+                    if op == "$ne":
+                        if value == operand:
+                            return False
+                        continue
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > operand:
+                        return False
+                    if op == "$lt" and not value < operand:
+                        return False
+                    if op == "$gte" and not value >= operand:
+                        return False
+                    if op == "$lte" and not value <= operand:
+                        return False
+                else:
+                    raise NotImplementedError(op)
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.documents.sort(key=lambda document: document.get(field), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the paths under test."""
+
+    def __init__(self, documents=None):
+        self.documents = [dict(document) for document in documents or []]
+        self.indexes = {}
+        self.options = {}
+        self.exists = False
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([dict(document) for document in self.documents if _matches(document, query or {})])
+
+    async def find_one(self, query=None, projection=None):
+        for document in self.documents:
+            if _matches(document, query or {}):
+                return dict(document)
+        return None
+
+    async def insert_one(self, document):
+        self.documents.append(dict(document))
+
+    async def update_one(self, query, update):
+        for document in self.documents:
+            if _matches(document, query):
+                document.update(update["$set"])
+                return SimpleNamespace(matched_count=1)
+        return SimpleNamespace(matched_count=0)
+
+    async def delete_many(self, query):
+        self.documents = [document for document in self.documents if not _matches(document, query)]
+
+    async def update_many(self, query, update):
+        for document in self.documents:
+            if _matches(document, query):
+                document.update(update["$set"])
+
+    async def estimated_document_count(self):
+        return len(self.documents)
+
+    async def index_information(self):
+        information = {"_id_": {"key": [("_id", 1)]}} if self.exists else {}
+        information.update({name: dict(index) for name, index in self.indexes.items()})
+        return information
+
+    async def create_indexes(self, models):
+        self.exists = True
+        for model in models:
+            document = dict(model.document)
+            name = document.pop("name")
+            document["key"] = list(document["key"].items())
+            self.indexes[name] = document
+
+    async def drop_index(self, name):
+        del self.indexes[name]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    async def list_collections(self, filter=None):
+        # Motor returns the cursor from a coroutine
+        return FakeCursor([
+            {"name": name, "options": collection.options}
+            for name, collection in self.collections.items()
+            if collection.exists and _matches({"name": name}, filter or {})
+        ])
+
+    async def create_collection(self, name, **options):
+        collection = getattr(self, name)
+        if collection.exists:
+            raise CollectionInvalid(f"collection {name} already exists")
+        collection.exists = True
+        collection.options = options
+
+    async def drop_collection(self, name):
+        self.collections.pop(name, None)
+
+    async def command(self, name, collection_name, index=None):
+        assert name == "collMod"
+        self.collections[collection_name].indexes[index["name"]]["expireAfterSeconds"] = index["expireAfterSeconds"]
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    import server
+
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    return database
@@ -0,0 +1,65 @@
+import asyncio
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+CONTENT = b"essay draft"
+ENCODED = base64.b64encode(CONTENT).decode()
+
+
+@pytest.fixture
+def store(fake_db, tmp_path, monkeypatch):
+    store = server.FilesystemBlobStore(tmp_path)
+    monkeypatch.setattr(server, "blob_store", store)
+    return store
+
+
+def test_migration_moves_embedded_attachments(fake_db, store):
+    fake_db.essay_requests.documents.append({"id": "request", "student_id": "student", "attachments": [ENCODED]})
+
+    assert asyncio.run(server.migrate_embedded_attachments()) == 1
+
+    [attachment] = fake_db.attachments.documents
+    [ref] = fake_db.essay_requests.documents[0]["attachments"]
+    assert ref["id"] == attachment["id"]
+    assert attachment["size"] == len(CONTENT)
+
+
+def test_migration_skips_request_changed_by_another_worker(fake_db, store, monkeypatch):
+    request = {"id": "request", "student_id": "student", "attachments": [ENCODED]}
+    fake_db.essay_requests.documents.append(dict(request))
+    migrated = {"id": "elsewhere", "storage_key": "other", "sha256": "other"}
+    store_base64_attachment = server.store_base64_attachment
+
+    async def racing_store(*args, **kwargs):
+        attachment = await store_base64_attachment(*args, **kwargs)
+        # Another worker finishes the same request first
+        fake_db.essay_requests.documents[0]["attachments"] = [migrated]
+        return attachment
+
+    monkeypatch.setattr(server, "store_base64_attachment", racing_store)
+
+    assert asyncio.run(server.migrate_embedded_attachments()) == 0
+    assert fake_db.essay_requests.documents[0]["attachments"] == [migrated]
+    # The losing pass leaves no orphaned records or blobs behind
+    assert fake_db.attachments.documents == []
+    assert not any(path.is_file() for path in store.root.rglob("*") if "tmp" not in path.parts)
+
+
+def test_base64_upload_over_limit_is_rejected(fake_db, store, monkeypatch):
+    monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 4)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.store_base64_attachment(ENCODED, "student", "attachment-1"))
+    assert error.value.status_code == 413
+    assert fake_db.attachments.documents == []
+
+
+def test_migration_ignores_upload_limit(fake_db, store, monkeypatch):
+    monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 4)
+    fake_db.essay_requests.documents.append({"id": "request", "student_id": "student", "attachments": [ENCODED]})
+
+    assert asyncio.run(server.migrate_embedded_attachments()) == 1
+    assert fake_db.attachments.documents[0]["size"] == len(CONTENT)
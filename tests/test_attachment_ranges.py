@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import server
+
+CONTENT = b"0123456789"
+OWNER = server.User(id="owner", email="o@example.com", name="Owner", role="student", password_hash="")
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-4", 10, (0, 4)),
+    ("bytes=5-", 10, (5, 9)),
+    ("bytes=5-100", 10, (5, 9)),
+    ("bytes=-3", 10, (7, 9)),
+    ("bytes=-30", 10, (0, 9)),
+    ("bytes=5-2", 10, None),
+    ("bytes=0-1,4-5", 10, None),
+    ("bytes=-", 10, None),
+    ("items=0-4", 10, None),
+])
+def test_parse_range(header, size, expected):
+    assert server.parse_range(header, size) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=10-", 10),
+    ("bytes=10-20", 10),
+    ("bytes=-0", 10),
+    ("bytes=-5", 0),
+    ("bytes=0-", 0),
+])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(HTTPException) as error:
+        server.parse_range(header, size)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == f"bytes */{size}"
+
+
+@pytest.fixture
+def attachment(fake_db, tmp_path, monkeypatch):
+    store = server.FilesystemBlobStore(tmp_path)
+    monkeypatch.setattr(server, "blob_store", store)
+
+    async def chunks():
+        yield CONTENT
+
+    storage_key, sha256, size = asyncio.run(store.write(chunks(), "file.txt"))
+    document = {
+        "id": "attachment", "filename": "file.txt", "content_type": "text/plain", "size": size,
+        "sha256": sha256, "storage_key": storage_key, "uploaded_by": OWNER.id,
+    }
+    fake_db.attachments.documents.append(document)
+    return document
+
+
+def download(headers):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/attachments/attachment",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+
+    async def run():
+        response = await server.download_attachment("attachment", Request(scope), current_user=OWNER)
+        body = b""
+        if hasattr(response, "body_iterator"):
+            async for chunk in response.body_iterator:
+                body += chunk
+        return response, body
+
+    return asyncio.run(run())
+
+
+def test_range_request_returns_partial_content(attachment):
+    response, body = download({"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert body == b"234"
+    assert response.headers["Content-Range"] == "bytes 2-4/10"
+
+
+def test_invalid_range_returns_full_body(attachment):
+    response, body = download({"Range": "bytes=5-2"})
+    assert response.status_code == 200
+    assert body == CONTENT
+    assert "Content-Range" not in response.headers
+
+
+def test_if_none_match_returns_not_modified(attachment):
+    etag = f'"{attachment["sha256"]}"'
+    response, body = download({"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert body == b""
+
+
+def test_if_range_with_current_etag_honours_range(attachment):
+    response, body = download({"Range": "bytes=0-1", "If-Range": f'"{attachment["sha256"]}"'})
+    assert response.status_code == 206
+    assert body == b"01"
+
+
+def test_if_range_with_stale_etag_returns_full_body(attachment):
+    response, body = download({"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert body == CONTENT
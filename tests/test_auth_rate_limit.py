@@ -0,0 +1,32 @@
+import pytest
+from starlette.requests import Request
+
+import server
+
+
+def make_request(forwarded=None, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+@pytest.mark.parametrize("forwarded, trusted_proxies, expected", [
+    (None, 0, "10.0.0.1"),
+    ("1.2.3.4", 0, "10.0.0.1"),
+    ("1.2.3.4", 1, "1.2.3.4"),
+    ("6.6.6.6, 1.2.3.4", 1, "1.2.3.4"),
+    ("6.6.6.6, 1.2.3.4, 10.0.0.9", 2, "1.2.3.4"),
+    (None, 1, "10.0.0.1"),
+])
+def test_client_ip_reads_the_trusted_hop(forwarded, trusted_proxies, expected):
+    assert server.client_ip(make_request(forwarded), trusted_proxies) == expected
+
+
+def test_limiter_rejects_over_limit_without_counting_rejections():
+    limiter = server.SlidingWindowLimiter(window_seconds=300, max_keys=10)
+    limits = [("login:email:a@example.com", 2)]
+
+    assert limiter.check(limits) is None
+    assert limiter.check(limits) is None
+    assert limiter.check(limits) > 0
+    assert limiter.stats()["allowed"] == 2
+    assert limiter.stats()["rejected"] == 1
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from fastapi import Response
+
+import server
+
+STUDENT = server.User(id="student", email="s@example.com", name="Student", role="student", password_hash="")
+
+
+def fetch(request_id, since=None, since_id=None, limit=None):
+    response = Response()
+    messages = asyncio.run(server.get_chat_messages(
+        request_id,
+        response,
+        since=since,
+        since_id=since_id,
+        before=None,
+        limit=limit,
+        current_user=STUDENT,
+    ))
+    mark = response.headers.get("X-High-Water-Mark")
+    return (
+        messages,
+        datetime.fromisoformat(mark) if mark else None,
+        response.headers.get("X-High-Water-Id"),
+        response.headers["X-Has-More"] == "true",
+    )
+
+
+def test_delta_pages_through_late_approvals_without_repeating(fake_db):
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    fake_db.essay_requests.documents.append(
+        {"id": "request", "student_id": "student", "assigned_supervisor": "supervisor"}
+    )
+    fake_db.chat_messages.documents.append({
+        "id": "m-recent", "request_id": "request", "sender_id": "supervisor", "receiver_id": "student",
+        "message": "recent", "timestamp": start + timedelta(hours=1), "approved": True,
+        "approved_at": start + timedelta(hours=1), "visible_at": start + timedelta(hours=1),
+    })
+    # A backlog written before the client's mark, still awaiting approval
+    for i in range(5):
+        fake_db.chat_messages.documents.append({
+            "id": f"m-{i}", "request_id": "request", "sender_id": "supervisor", "receiver_id": "student",
+            "message": f"old {i}", "timestamp": start + timedelta(minutes=i), "approved": False,
+            "visible_at": start + timedelta(minutes=i),
+        })
+
+    messages, since, since_id, _ = fetch("request")
+    assert [message.id for message in messages] == ["m-recent"]
+    assert since == start + timedelta(hours=1)
+
+    # An admin approves the whole backlog at once
+    approved_at = start + timedelta(hours=2)
+    for document in fake_db.chat_messages.documents:
+        if not document["approved"]:
+            document.update({"approved": True, "approved_at": approved_at, "visible_at": approved_at})
+
+    seen = []
+    for _ in range(10):
+        messages, next_since, next_since_id, has_more = fetch("request", since, since_id, limit=2)
+        seen.extend(message.id for message in messages)
+        assert (next_since, next_since_id) >= (since, since_id or "")
+        since, since_id = next_since, next_since_id
+        if not has_more:
+            break
+
+    assert sorted(seen) == [f"m-{i}" for i in range(5)]
+    assert len(seen) == len(set(seen))
+
+    # Caught up: the mark holds and nothing is returned
+    messages, next_since, next_since_id, has_more = fetch("request", since, since_id, limit=2)
+    assert messages == [] and not has_more
+    assert (next_since, next_since_id) == (since, since_id)
+
+
+def test_chat_messages_query_breaks_ties_on_id():
+    since = datetime(2024, 1, 1)
+    query = server.chat_messages_query("request", False, since, "m-1")
+    assert query["approved"] is True
+    assert query["$or"] == [{"visible_at": {"$gt": since}}, {"visible_at": since, "id": {"$gt": "m-1"}}]
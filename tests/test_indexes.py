@@ -0,0 +1,46 @@
+import asyncio
+
+import server
+
+
+def test_ensure_indexes_creates_compressed_archive_first(fake_db):
+    report = asyncio.run(server.ensure_indexes())
+
+    archive = fake_db.collections["notifications_archive"]
+    assert archive.options["storageEngine"]["wiredTiger"]["configString"] == "block_compressor=zstd"
+    assert set(report["notifications_archive"]["created"]) == {"id_unique", "user_id_created_at"}
+    assert all(not collection["missing"] for collection in report.values())
+
+
+def test_ensure_indexes_is_idempotent(fake_db):
+    asyncio.run(server.ensure_indexes())
+    report = asyncio.run(server.ensure_indexes())
+
+    for collection in report.values():
+        assert collection["created"] == []
+        assert collection["rebuilt"] == []
+        assert collection["unexpected"] == []
+
+
+def test_uncompressed_empty_archive_is_recreated(fake_db):
+    asyncio.run(fake_db.create_collection("notifications_archive"))
+
+    asyncio.run(server.ensure_notification_archive())
+
+    archive = fake_db.collections["notifications_archive"]
+    assert "block_compressor=zstd" in archive.options["storageEngine"]["wiredTiger"]["configString"]
+
+
+def test_ttl_index_with_stale_partial_filter_is_rebuilt(fake_db):
+    notifications = fake_db.notifications
+    notifications.exists = True
+    notifications.indexes["created_at_ttl"] = {
+        "key": [("created_at", 1)],
+        "expireAfterSeconds": server.NOTIFICATION_RETENTION_DAYS * 86400,
+        "partialFilterExpression": {"read": True},
+    }
+
+    report = asyncio.run(server.ensure_indexes())
+
+    assert "created_at_ttl" in report["notifications"]["rebuilt"]
+    assert notifications.indexes["created_at_ttl"]["partialFilterExpression"] == {"archived": True}